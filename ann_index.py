@@ -0,0 +1,145 @@
+import os
+import math
+import logging
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+
+# Index type built after ingestion: flat, ivf, hnsw, ivfpq, sq8 or fp16
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+# Corpora smaller than this keep an exact flat index; training and graph overhead do not pay off
+ANN_MIN_VECTORS = int(os.getenv("ANN_MIN_VECTORS", "10000"))
+# IVF cells (0 picks 4 * sqrt(n)) and cells probed per query
+FAISS_NLIST = int(os.getenv("FAISS_NLIST", "0"))
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+# HNSW graph degree and search breadth
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+# Bytes per vector of product quantization codes
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "96"))
+# Vectors sampled to train quantizers
+FAISS_TRAIN_SAMPLE = int(os.getenv("FAISS_TRAIN_SAMPLE", "262144"))
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq", "sq8", "fp16")
+# Index classes that store vectors exactly, so they can be reconstructed without re-embedding
+LOSSLESS_INDEXES = ("IndexFlat", "IndexFlatL2", "IndexFlatIP", "IndexIVFFlat", "IndexHNSWFlat")
+# FAISS k-means warns below this many training points per cell
+MIN_POINTS_PER_CELL = 39
+
+
+def factory_string(index_type: str, dimension: int, count: int) -> str:
+    """
+    Return the faiss.index_factory description of an index type sized for count vectors.
+    """
+    nlist = FAISS_NLIST or int(4 * math.sqrt(count))
+    nlist = max(1, min(nlist, count // MIN_POINTS_PER_CELL))
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "ivf":
+        return f"IVF{nlist},Flat"
+    if index_type == "hnsw":
+        return f"HNSW{FAISS_HNSW_M}"
+    if index_type == "ivfpq":
+        # PQ needs a number of sub-quantizers that divides the dimension
+        m = max(d for d in range(1, min(FAISS_PQ_M, dimension) + 1) if dimension % d == 0)
+        return f"IVF{nlist},PQ{m}"
+    if index_type == "sq8":
+        return "SQ8"
+    if index_type == "fp16":
+        return "SQfp16"
+    raise ValueError(f"Unknown FAISS index type {index_type!r}, expected one of {', '.join(INDEX_TYPES)}")
+
+
+def configure_search(index: faiss.Index, nprobe: int = FAISS_NPROBE, ef_search: int = FAISS_EF_SEARCH):
+    """
+    Apply the query-time recall/latency settings to an IVF or HNSW index; other indexes are left as is.
+    """
+    try:
+        faiss.extract_index_ivf(index).nprobe = nprobe
+    except RuntimeError:
+        pass
+    hnsw = getattr(faiss.downcast_index(index), "hnsw", None)
+    if hnsw is not None:
+        hnsw.efSearch = ef_search
+
+
+def enable_reconstruct(index: faiss.Index):
+    """
+    Let an IVF index look vectors up by position, so stored vectors can be reused at query time
+    (e.g. for diversity reranking); other index types already support it.
+    """
+    try:
+        faiss.extract_index_ivf(index).make_direct_map()
+    except RuntimeError:
+        pass
+
+
+def build_index(vectors: np.ndarray, index_type: str = FAISS_INDEX_TYPE, metric: int = faiss.METRIC_L2) -> faiss.Index:
+    """
+    Build an index of the given type over vectors, training it on (a sample of) the vectors first.
+    Positions in the index follow the row order of vectors.
+    """
+    count, dimension = vectors.shape
+    description = factory_string(index_type, dimension, count)
+    if index_type != "flat" and count < ANN_MIN_VECTORS:
+        logging.info(f"{count} vectors is below ANN_MIN_VECTORS, keeping a flat index instead of {index_type}")
+        description = "Flat"
+
+    index = faiss.index_factory(dimension, description, metric)
+    if not index.is_trained:
+        sample = vectors
+        if count > FAISS_TRAIN_SAMPLE:
+            sample = vectors[np.random.default_rng(0).choice(count, FAISS_TRAIN_SAMPLE, replace=False)]
+        index.train(sample)
+    index.add(vectors)
+    configure_search(index)
+    logging.info(f"Built {description} index over {count} vectors")
+    return index
+
+
+def index_metric(vectorstore: FAISS) -> int:
+    if vectorstore.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT:
+        return faiss.METRIC_INNER_PRODUCT
+    return faiss.METRIC_L2
+
+
+def is_lossless(index: faiss.Index) -> bool:
+    return type(faiss.downcast_index(index)).__name__ in LOSSLESS_INDEXES
+
+
+def vectorstore_vectors(vectorstore: FAISS) -> np.ndarray:
+    """
+    Return the vectors of the vector store in index order.
+    Lossy indexes cannot give back their inputs, so their documents are re-embedded through the
+    vector store's embedding function, which is served from the embedding cache after ingestion.
+    """
+    index = vectorstore.index
+    if is_lossless(index):
+        enable_reconstruct(index)
+        return index.reconstruct_n(0, index.ntotal)
+
+    logging.info(f"Index is quantized, re-embedding {index.ntotal} documents to recover exact vectors")
+    positions = sorted(vectorstore.index_to_docstore_id)
+    texts = [vectorstore.docstore.search(vectorstore.index_to_docstore_id[p]).page_content for p in positions]
+    vectors = np.array(vectorstore.embedding_function.embed_documents(texts), dtype=np.float32)
+    if vectorstore._normalize_L2:
+        faiss.normalize_L2(vectors)
+    return vectors
+
+
+def convert_index(vectorstore: FAISS, index_type: str = FAISS_INDEX_TYPE):
+    """
+    Replace the vector store's index with one of index_type holding the same vectors in the same order.
+    """
+    if index_type == "flat" and isinstance(faiss.downcast_index(vectorstore.index), faiss.IndexFlat):
+        return
+    vectorstore.index = build_index(vectorstore_vectors(vectorstore), index_type, index_metric(vectorstore))
+
+
+def to_flat(vectorstore: FAISS):
+    """
+    Replace the vector store's index with an exact flat index, which supports adding and deleting vectors.
+    """
+    convert_index(vectorstore, "flat")
@@ -0,0 +1,152 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+# Minimum cosine similarity between query embeddings for a cached answer to be reused
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2048"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(24 * 3600)))
+
+
+class _Entry:
+    __slots__ = ("collection", "settings", "vector", "chunk_ids", "value", "cost", "expires_at")
+
+    def __init__(self, collection, settings, vector, chunk_ids, value, cost, expires_at):
+        self.collection = collection
+        self.settings = settings
+        self.vector = vector
+        self.chunk_ids = chunk_ids
+        self.value = value
+        self.cost = cost
+        self.expires_at = expires_at
+
+
+class AnswerCache:
+    """
+    Semantic cache of generated answers, so paraphrases of a question already answered skip the LLM.
+
+    An entry holds the normalized embedding of the question, the ids of the excerpts a search for the
+    question as typed retrieved and the answer. A new question reuses the answer of the most similar
+    cached question in the same collection and settings when their cosine similarity reaches the
+    threshold and its own search retrieved exactly the same excerpts, so a hit is decided before the
+    question is refined or answered. Entries are dropped when their collection's index version
+    changes, and otherwise kept in an in-process LRU with a TTL.
+    """
+
+    def __init__(
+        self,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        ttl: float = ANSWER_CACHE_TTL_SECONDS,
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.saved_seconds = 0.0
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._versions: Dict[str, Optional[str]] = {}
+        self._next_id = 0
+        # Stacked entry vectors and the entry ids of their rows, rebuilt after entries change
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_ids: List[int] = []
+        self._lock = threading.Lock()
+
+    def _check_version(self, collection: str, version: Optional[str]):
+        if self._versions.get(collection, version) != version:
+            stale = [entry_id for entry_id, entry in self._entries.items() if entry.collection == collection]
+            for entry_id in stale:
+                del self._entries[entry_id]
+            self._matrix = None
+            self.invalidations += 1
+            logging.info(f"Index of collection '{collection}' changed, dropped {len(stale)} cached answers")
+        self._versions[collection] = version
+
+    def _stacked(self) -> np.ndarray:
+        if self._matrix is None:
+            self._matrix_ids = list(self._entries)
+            vectors = [self._entries[entry_id].vector for entry_id in self._matrix_ids]
+            self._matrix = np.stack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+        return self._matrix
+
+    def lookup(
+        self,
+        collection: str,
+        version: Optional[str],
+        vector: np.ndarray,
+        chunk_ids: List[str],
+        settings: Tuple[Hashable, ...] = (),
+    ) -> Optional[Any]:
+        """
+        Return the cached answer for a question whose embedding is vector and whose search retrieved
+        the excerpts chunk_ids, or None. settings holds request options that change the answer.
+        """
+        query = _normalized(vector)
+        now = time.time()
+        with self._lock:
+            self._check_version(collection, version)
+            matrix = self._stacked()
+            if len(matrix):
+                similarities = matrix @ query
+                for row in np.argsort(-similarities):
+                    if similarities[row] < self.threshold:
+                        break
+                    entry_id = self._matrix_ids[row]
+                    entry = self._entries[entry_id]
+                    if entry.expires_at <= now:
+                        continue
+                    if entry.collection == collection and entry.settings == settings and entry.chunk_ids == set(chunk_ids):
+                        self._entries.move_to_end(entry_id)
+                        self.hits += 1
+                        self.saved_seconds += entry.cost
+                        logging.debug(f"Answer cache hit, similarity {similarities[row]:.3f}")
+                        return entry.value
+            self.misses += 1
+            return None
+
+    def store(
+        self,
+        collection: str,
+        version: Optional[str],
+        vector: np.ndarray,
+        chunk_ids: List[str],
+        value: Any,
+        cost: float,
+        settings: Tuple[Hashable, ...] = (),
+    ):
+        """
+        Cache the answer to a question whose search retrieved the excerpts chunk_ids; cost is the time generating it took.
+        """
+        with self._lock:
+            self._check_version(collection, version)
+            self._entries[self._next_id] = _Entry(
+                collection, settings, _normalized(vector), set(chunk_ids), value, cost, time.time() + self.ttl
+            )
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "saved_seconds": round(self.saved_seconds, 3),
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+        }
+
+
+def _normalized(vector: np.ndarray) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
@@ -0,0 +1,105 @@
+"""
+Measure the recall, latency and memory trade-off of each FAISS index type against exact search.
+
+Vectors come from the current snapshot (--snapshot) or a synthetic clustered corpus. Queries are
+perturbed copies of corpus vectors; ground truth is exact flat search. For every index type the
+script reports recall@k, p50/p99 single-query latency, bytes per vector and build time, using
+the same build path and search settings (FAISS_NPROBE, FAISS_EF_SEARCH, ...) as the service.
+
+Usage (from the repository root):
+    python -m benchmarks.ann_recall --vectors 200000 --dim 1536 --types flat ivf hnsw ivfpq sq8 fp16
+    python -m benchmarks.ann_recall --snapshot vector_store/default
+"""
+import time
+import argparse
+
+import faiss
+import numpy as np
+
+import ann_index
+
+
+def synthetic_vectors(count: int, dim: int, clusters: int = 256) -> np.ndarray:
+    """
+    Gaussian clusters of unit vectors, which search like real embeddings far better than uniform noise.
+    """
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((clusters, dim)).astype("float32")
+    vectors = np.empty((count, dim), dtype="float32")
+    for start in range(0, count, 10000):
+        size = min(10000, count - start)
+        vectors[start:start + size] = centers[rng.integers(clusters, size=size)] + 0.5 * rng.standard_normal((size, dim))
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def snapshot_vectors(root: str) -> np.ndarray:
+    from vector_snapshot import INDEX_FILE, current_version
+
+    version = current_version(root)
+    if version is None:
+        raise SystemExit(f"No snapshot found under {root}")
+    index = faiss.read_index(f"{root}/{version}/{INDEX_FILE}")
+    if not ann_index.is_lossless(index):
+        raise SystemExit("The snapshot index is quantized; rebuild it with FAISS_INDEX_TYPE=flat to benchmark it")
+    try:
+        faiss.extract_index_ivf(index).make_direct_map()
+    except RuntimeError:
+        pass
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def evaluate(index: faiss.Index, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    latencies = []
+    hits = 0
+    for i, query in enumerate(queries):
+        started = time.perf_counter()
+        _, found = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - started)
+        hits += len(set(found[0]) & set(truth[i]))
+    latencies.sort()
+    return {
+        "recall": hits / truth.size,
+        "p50_ms": 1000 * latencies[len(latencies) // 2],
+        "p99_ms": 1000 * latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        "bytes_per_vector": faiss.serialize_index(index).nbytes / index.ntotal,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--snapshot", help="read vectors from the snapshot under this collection directory, e.g. vector_store/default")
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--types", nargs="+", default=list(ann_index.INDEX_TYPES), choices=ann_index.INDEX_TYPES)
+    args = parser.parse_args()
+
+    vectors = snapshot_vectors(args.snapshot) if args.snapshot else synthetic_vectors(args.vectors, args.dim)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), args.queries, replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype("float32")
+    faiss.normalize_L2(queries)
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.k)
+
+    # The point is to measure the ANN types, so do not let small corpora fall back to flat
+    ann_index.ANN_MIN_VECTORS = 0
+    print(f"{len(vectors)} vectors x {vectors.shape[1]} dims, {args.queries} queries, recall@{args.k}")
+    print(f"{'type':<8}{'recall':>8}{'p50 (ms)':>10}{'p99 (ms)':>10}{'bytes/vec':>11}{'build (s)':>11}")
+    for index_type in args.types:
+        started = time.perf_counter()
+        index = ann_index.build_index(vectors, index_type)
+        build_s = time.perf_counter() - started
+        result = evaluate(index, queries, truth, args.k)
+        print(
+            f"{index_type:<8}{result['recall']:>8.3f}{result['p50_ms']:>10.3f}{result['p99_ms']:>10.3f}"
+            f"{result['bytes_per_vector']:>11.0f}{build_s:>11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
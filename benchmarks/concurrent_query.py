@@ -0,0 +1,96 @@
+"""
+Load-test /query in-process against a stubbed LLM to check that throughput scales with concurrency.
+
+The OpenAI chat client is replaced by a stub that sleeps for a fixed latency per completion, and
+the vector store is a small synthetic FAISS index with fake embeddings, so no network is used.
+With a non-blocking pipeline, requests per second should grow roughly linearly with concurrency
+until the search executor saturates; a blocking pipeline stays flat at about 1 / (3 x latency).
+
+Usage (from the repository root):
+    python -m benchmarks.concurrent_query --requests 200 --concurrency 1 10 50 --latency 0.2
+"""
+import os
+import time
+import asyncio
+import argparse
+import statistics
+from types import SimpleNamespace
+
+import httpx
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import main
+from langchain_community.embeddings import FakeEmbeddings
+from langchain_community.vectorstores import FAISS
+from lexical_index import LexicalIndex
+from vector_snapshot import SearchIndex
+
+
+class StubCompletions:
+    """
+    Stand-in for client.chat.completions that answers after a fixed delay.
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def create(self, **kwargs):
+        await asyncio.sleep(self.latency)
+        message = SimpleNamespace(content="stub completion")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+async def run_level(http: httpx.AsyncClient, requests: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i: int):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await http.post("/query", json={"query": f"what is a forfeited amount {i}"})
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "rps": requests / elapsed,
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+async def run(args):
+    main.client = SimpleNamespace(chat=SimpleNamespace(completions=StubCompletions(args.latency)))
+    texts = [f"Synthetic provision {i} about forfeited amounts and taxable income." for i in range(args.chunks)]
+    ids = [str(i) for i in range(args.chunks)]
+    vectorstore = FAISS.from_texts(
+        texts, FakeEmbeddings(size=1536), metadatas=[{"reference": str(i)} for i in range(args.chunks)], ids=ids
+    )
+    lexical = LexicalIndex()
+    lexical.add(ids, texts)
+    main.collections.put(main.DEFAULT_COLLECTION, SearchIndex(vectorstore, lexical))
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as http:
+        print(f"{'concurrency':>12}{'req/s':>10}{'p50 (s)':>10}{'p95 (s)':>10}")
+        for concurrency in args.concurrency:
+            result = await run_level(http, args.requests, concurrency)
+            print(f"{concurrency:>12}{result['rps']:>10.1f}{result['p50']:>10.3f}{result['p95']:>10.3f}")
+    print(f"A fully blocking pipeline would stay near {1 / (3 * args.latency):.1f} req/s at every level.")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--latency", type=float, default=0.2, help="stubbed seconds per LLM completion")
+    parser.add_argument("--chunks", type=int, default=5000)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,271 @@
+"""
+Offline end-to-end load test of the service against a local fake OpenAI server.
+
+Starts benchmarks.fake_openai and main:app as separate uvicorn processes, with the service's
+OpenAI clients pointed at the fake (OPENAI_BASE_URL, OPENAI_API_BASE) and its vector store and
+caches in a temporary directory. Then:
+
+1. ingests a fixture statute XML through /process_xml and reports chunks/sec from /jobs,
+2. streams a PDF (1.pdf by default) through pdf_pipeline.index_pdf into an in-memory Pinecone
+   stand-in, embedding through the fake server, and reports chunks/sec,
+3. replays a JSONL query log against /query and /query_results at each concurrency level and
+   reports p50/p95/p99 latency and requests/sec per endpoint.
+
+Log lines are Query objects, e.g. {"query": "...", "top_k": 5}, with an optional "endpoint"; lines
+without one are sent to every endpoint in --endpoints. The service's caches stay warm between
+concurrency levels, as they would in production. No request leaves the machine, except that
+tiktoken needs its encoding file cached (TIKTOKEN_CACHE_DIR) if there is no network at all.
+
+Usage (from the repository root):
+    python -m benchmarks.e2e_load --concurrency 1 8 32 --requests 200 --latency 0.5 --tokens-per-second 50
+    python -m benchmarks.e2e_load --xml statute.xml --queries my_log.jsonl --pdf ""
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from typing import Dict, List
+
+import httpx
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_QUERIES = os.path.join(REPO_ROOT, "benchmarks", "fixtures", "queries.jsonl")
+DEFAULT_PDF = os.path.join(REPO_ROOT, "1.pdf")
+
+# Sentences the fixture statute is written from, on the topics of the default query log
+FIXTURE_TOPICS = [
+    "A taxpayer shall include in computing income any capital gain from the disposition of property in the year.",
+    "Every corporation shall file a return of income for each taxation year within six months after the end of the year.",
+    "A forfeited amount received by the taxpayer under a contract is included in computing income.",
+    "Every person who fails to file a return of income as and when required is liable to a penalty for late filing.",
+    "An individual may deduct an amount in respect of gifts to a registered charity, calculated on the eligible amount.",
+    "An employee may deduct employment expenses paid in the year where the contract of employment required the payment.",
+    "A taxable dividend received from a taxable Canadian corporation is included in income, grossed up by the prescribed rate.",
+    "Interest at the prescribed rate is payable on any unpaid instalment from the day it was due.",
+    "A taxpayer may deduct capital cost allowance on depreciable property of a prescribed class.",
+    "A trust is resident in Canada where its central management and control is exercised in Canada.",
+    "A non-resident person shall pay tax on rent received from property situated in Canada.",
+    "Every person carrying on business shall keep records and books of account for six years.",
+    "An individual shall pay instalments on or before the fifteenth day of March, June, September and December.",
+    "A non-capital loss of a taxpayer may be carried forward and deducted in the twenty following taxation years.",
+]
+
+
+def fixture_xml(sections: int, seed: int = 0) -> str:
+    """
+    A deterministic statute of sections with subsections and paragraphs, in the service's XML schema.
+    """
+    rng = random.Random(seed)
+    parts = ["<Statute><Body>"]
+    for number in range(1, sections + 1):
+        topic = FIXTURE_TOPICS[number % len(FIXTURE_TOPICS)]
+        parts.append(f"<Section><MarginalNote>{topic.split(',')[0][:60]}</MarginalNote><Label>{number}</Label>")
+        for subsection in range(1, rng.randint(1, 4) + 1):
+            parts.append(f"<Subsection><Label>({subsection})</Label><Text>{topic} Subsection {subsection} applies to section {number}.</Text>")
+            for paragraph in "abcd"[:rng.randint(0, 4)]:
+                other = FIXTURE_TOPICS[rng.randrange(len(FIXTURE_TOPICS))]
+                parts.append(f"<Paragraph><Label>({paragraph})</Label><Text>subject to {other.lower()}</Text></Paragraph>")
+            parts.append("</Subsection>")
+        parts.append("</Section>")
+    parts.append("</Body></Statute>")
+    return "".join(parts)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(app: str, port: int, env: Dict[str, str], cwd: str, log_path: str) -> subprocess.Popen:
+    log = open(log_path, "w")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        env=env, cwd=cwd, stdout=log, stderr=subprocess.STDOUT,
+    )
+
+
+def wait_until_up(url: str, process: subprocess.Popen, log_path: str, timeout: float = 120.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Server exited with code {process.returncode}, see {log_path}")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise SystemExit(f"Server at {url} did not start within {timeout:.0f}s, see {log_path}")
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def ingest_xml(base_url: str, xml_path: str) -> dict:
+    with open(xml_path, "rb") as f:
+        response = httpx.post(f"{base_url}/process_xml", files={"file": ("fixture.xml", f, "application/xml")}, timeout=60)
+    response.raise_for_status()
+    job_id = response.json()["job_id"]
+    while True:
+        job = httpx.get(f"{base_url}/jobs/{job_id}", timeout=10).json()
+        if job["status"] in ("completed", "failed"):
+            break
+        time.sleep(0.5)
+    if job["status"] == "failed":
+        raise SystemExit(f"XML ingestion failed: {job['error']}")
+    return job
+
+
+def ingest_pdf(pdf_path: str) -> dict:
+    """
+    Run the streaming PDF pipeline with embeddings from the fake server and an in-memory index.
+    """
+    from langchain_community.embeddings import OpenAIEmbeddings
+
+    from memory_pinecone import InMemoryPineconeIndex
+    from pdf_pipeline import index_pdf, pinecone_existing, pinecone_upserter
+
+    index = InMemoryPineconeIndex()
+    embeddings = OpenAIEmbeddings()
+    return index_pdf(pdf_path, embeddings, pinecone_upserter(index), existing=pinecone_existing(index))
+
+
+def load_queries(path: str, endpoints: List[str]) -> List[tuple]:
+    requests = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            body = json.loads(line)
+            endpoint = body.pop("endpoint", None)
+            for target in [endpoint] if endpoint else endpoints:
+                requests.append((target, body))
+    if not requests:
+        raise SystemExit(f"No queries in {path}")
+    return requests
+
+
+async def replay(base_url: str, log: List[tuple], requests: int, concurrency: int) -> Dict[str, dict]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+
+    async def one(http: httpx.AsyncClient, endpoint: str, body: dict):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await http.post(endpoint, json=body)
+                ok = response.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.setdefault(endpoint, []).append(time.perf_counter() - started)
+            else:
+                errors[endpoint] = errors.get(endpoint, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as http:
+        started = time.perf_counter()
+        await asyncio.gather(*(one(http, *log[i % len(log)]) for i in range(requests)))
+        elapsed = time.perf_counter() - started
+
+    report = {}
+    for endpoint in sorted(set(latencies) | set(errors)):
+        values = sorted(latencies.get(endpoint, []))
+        report[endpoint] = {
+            "requests": len(values),
+            "errors": errors.get(endpoint, 0),
+            "rps": len(values) / elapsed,
+            "p50": percentile(values, 0.50) if values else float("nan"),
+            "p95": percentile(values, 0.95) if values else float("nan"),
+            "p99": percentile(values, 0.99) if values else float("nan"),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--xml", help="statute XML to ingest instead of the generated fixture")
+    parser.add_argument("--sections", type=int, default=500, help="sections in the generated fixture")
+    parser.add_argument("--pdf", default=DEFAULT_PDF, help="PDF to stream through the PDF pipeline; empty to skip")
+    parser.add_argument("--queries", default=DEFAULT_QUERIES, help="JSONL query log to replay")
+    parser.add_argument("--endpoints", nargs="+", default=["/query", "/query_results"])
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--latency", type=float, default=0.5, help="fake completion latency before the first token (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--completion-tokens", type=int, default=200)
+    parser.add_argument("--embedding-latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    log = load_queries(args.queries, args.endpoints)
+    fake_port, service_port = free_port(), free_port()
+    fake_url = f"http://127.0.0.1:{fake_port}/v1"
+    service_url = f"http://127.0.0.1:{service_port}"
+
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(
+            os.environ,
+            PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")])),
+            OPENAI_API_KEY="benchmark",
+            OPENAI_BASE_URL=fake_url,
+            OPENAI_API_BASE=fake_url,
+            EMBEDDING_CACHE_PATH=os.path.join(workdir, "embedding_cache.sqlite"),
+            FAKE_COMPLETION_LATENCY=str(args.latency),
+            FAKE_TOKENS_PER_SECOND=str(args.tokens_per_second),
+            FAKE_COMPLETION_TOKENS=str(args.completion_tokens),
+            FAKE_EMBEDDING_LATENCY=str(args.embedding_latency),
+        )
+        # The PDF pipeline runs in this process and embeds through the fake server too
+        os.environ.update({key: env[key] for key in ("OPENAI_API_KEY", "OPENAI_BASE_URL", "OPENAI_API_BASE", "EMBEDDING_CACHE_PATH")})
+        sys.path.insert(0, REPO_ROOT)
+
+        servers = []
+        try:
+            fake_log = os.path.join(workdir, "fake_openai.log")
+            servers.append(start_server("benchmarks.fake_openai:app", fake_port, env, REPO_ROOT, fake_log))
+            wait_until_up(f"{fake_url}/models", servers[-1], fake_log)
+            service_log = os.path.join(workdir, "service.log")
+            # The service runs in the temporary directory so its vector store does not touch the repository
+            servers.append(start_server("main:app", service_port, env, workdir, service_log))
+            wait_until_up(f"{service_url}/collections", servers[-1], service_log)
+
+            xml_path = args.xml
+            if not xml_path:
+                xml_path = os.path.join(workdir, "fixture.xml")
+                with open(xml_path, "w") as f:
+                    f.write(fixture_xml(args.sections))
+            job = ingest_xml(service_url, xml_path)
+            print(f"XML ingestion: {job['chunks_embedded']} chunks in {job['elapsed_seconds']:.1f}s, "
+                  f"{job['chunks_per_second']:.1f} chunks/s")
+
+            if args.pdf:
+                stats = ingest_pdf(args.pdf)
+                print(f"PDF ingestion: {stats['pages']} pages, {stats['chunks']} chunks in {stats['elapsed_seconds']:.1f}s, "
+                      f"{stats['chunks'] / stats['elapsed_seconds']:.1f} chunks/s")
+
+            print(f"\nReplaying {args.queries}: {len(log)} requests in the log, {args.requests} per level")
+            print(f"{'endpoint':<16}{'conc.':>6}{'ok':>6}{'errors':>8}{'req/s':>9}{'p50 (s)':>9}{'p95 (s)':>9}{'p99 (s)':>9}")
+            for concurrency in args.concurrency:
+                report = asyncio.run(replay(service_url, log, args.requests, concurrency))
+                for endpoint, r in report.items():
+                    print(f"{endpoint:<16}{concurrency:>6}{r['requests']:>6}{r['errors']:>8}{r['rps']:>9.1f}"
+                          f"{r['p50']:>9.3f}{r['p95']:>9.3f}{r['p99']:>9.3f}")
+        finally:
+            for server in reversed(servers):
+                server.terminate()
+                try:
+                    server.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    server.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Local stand-in for the OpenAI embeddings and chat completions APIs, for offline benchmarks.
+
+Embeddings are deterministic hashed bags of words, so texts sharing words get similar vectors
+and retrieval behaves plausibly. Completions wait FAKE_COMPLETION_LATENCY seconds, then produce
+tokens at FAKE_TOKENS_PER_SECOND, streamed or not. Refinement prompts that ask for JSON get
+valid JSON back; answers are built from the words of the prompt.
+
+Usage (from the repository root):
+    FAKE_COMPLETION_LATENCY=0.5 python -m uvicorn benchmarks.fake_openai:app --port 8100
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1 OPENAI_API_BASE=http://127.0.0.1:8100/v1 uvicorn main:app
+"""
+import os
+import re
+import json
+import time
+import uuid
+import base64
+import asyncio
+import hashlib
+from typing import Any, Dict, Iterator, List, Union
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+# Embedding size, and the delay of an embeddings request
+FAKE_EMBEDDING_DIM = int(os.getenv("FAKE_EMBEDDING_DIM", "1536"))
+FAKE_EMBEDDING_LATENCY = float(os.getenv("FAKE_EMBEDDING_LATENCY", "0.02"))
+# Delay before the first completion token, generation speed and answer length
+FAKE_COMPLETION_LATENCY = float(os.getenv("FAKE_COMPLETION_LATENCY", "0.5"))
+FAKE_TOKENS_PER_SECOND = float(os.getenv("FAKE_TOKENS_PER_SECOND", "50"))
+FAKE_COMPLETION_TOKENS = int(os.getenv("FAKE_COMPLETION_TOKENS", "200"))
+
+WORD_PATTERN = re.compile(r"\w+")
+
+app = FastAPI()
+
+
+def embed(item: Union[str, List[int]]) -> np.ndarray:
+    """
+    Hash each word (or token id) to a dimension and a sign, and return the normalized sum.
+    """
+    words = WORD_PATTERN.findall(item.lower()) if isinstance(item, str) else [str(token) for token in item]
+    vector = np.zeros(FAKE_EMBEDDING_DIM, dtype=np.float32)
+    for word in words or [""]:
+        digest = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+        vector[digest % FAKE_EMBEDDING_DIM] += 1.0 if digest >> 63 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    inputs = body["input"]
+    # A single string or token list, or a list of either
+    if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+        inputs = [inputs]
+    await asyncio.sleep(FAKE_EMBEDDING_LATENCY)
+
+    data = []
+    for i, item in enumerate(inputs):
+        vector = embed(item)
+        if body.get("encoding_format") == "base64":
+            embedding = base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii")
+        else:
+            embedding = vector.tolist()
+        data.append({"object": "embedding", "index": i, "embedding": embedding})
+    tokens = sum(len(item) if isinstance(item, list) else len(WORD_PATTERN.findall(item)) for item in inputs)
+    return {
+        "object": "list",
+        "data": data,
+        "model": body.get("model", "text-embedding-ada-002"),
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+    }
+
+
+def completion_text(messages: List[Dict[str, str]], max_tokens: int) -> str:
+    """
+    Answer refinement prompts with the question itself and answer prompts with words from the prompt.
+    """
+    system = next((m["content"] for m in messages if m["role"] == "system"), "")
+    user = messages[-1]["content"]
+    question = user.split(": ", 1)[-1].split("\n", 1)[0].strip()
+    if "Respond with JSON" in system:
+        return json.dumps({"refined_query": question, "search_terms": question})
+    if "Question:" not in user:
+        return question
+    words = WORD_PATTERN.findall(user) or ["answer"]
+    count = min(FAKE_COMPLETION_TOKENS, max_tokens)
+    return " ".join(words[i % len(words)] for i in range(count))
+
+
+def tokens_of(text: str) -> Iterator[str]:
+    for i, word in enumerate(text.split(" ")):
+        yield word if i == 0 else " " + word
+
+
+def chunk(completion_id: str, model: str, delta: Dict[str, Any], finish_reason=None) -> str:
+    payload = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "gpt-4")
+    text = completion_text(body["messages"], body.get("max_tokens") or FAKE_COMPLETION_TOKENS)
+    tokens = list(tokens_of(text))
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    prompt_tokens = sum(len(WORD_PATTERN.findall(m["content"])) for m in body["messages"])
+    usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens), "total_tokens": prompt_tokens + len(tokens)}
+    await asyncio.sleep(FAKE_COMPLETION_LATENCY)
+
+    if body.get("stream"):
+        async def events():
+            yield chunk(completion_id, model, {"role": "assistant", "content": ""})
+            for token in tokens:
+                await asyncio.sleep(1 / FAKE_TOKENS_PER_SECOND)
+                yield chunk(completion_id, model, {"content": token})
+            yield chunk(completion_id, model, {}, finish_reason="stop")
+            if (body.get("stream_options") or {}).get("include_usage"):
+                payload = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                           "model": model, "choices": [], "usage": usage}
+                yield f"data: {json.dumps(payload)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    await asyncio.sleep(len(tokens) / FAKE_TOKENS_PER_SECOND)
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": usage,
+    }
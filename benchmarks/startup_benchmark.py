@@ -0,0 +1,115 @@
+"""
+Compare cold start of the service's vector store: the old pickle path against a native snapshot.
+
+Builds a synthetic store of random vectors, writes it in both formats, then loads each one in a
+fresh interpreter and reports load time, first-search time and memory growth over load and first
+search. Memory is split into private (anonymous) pages, which every worker pays for, and
+file-backed pages of a mapped index, which sit in the shared, reclaimable page cache.
+
+Usage (from the repository root):
+    python -m benchmarks.startup_benchmark --vectors 200000 --dim 1536
+"""
+import os
+import sys
+import json
+import pickle
+import argparse
+import tempfile
+import subprocess
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.embeddings import FakeEmbeddings
+from langchain_community.vectorstores import FAISS
+
+from vector_snapshot import save_snapshot
+
+# (imports, load) code run in the child; imports are excluded from the timed load
+LOADERS = {
+    "pickle": (
+        "import pickle, faiss\n"
+        "from langchain_community.docstore.in_memory import InMemoryDocstore\n",
+        "with open({path!r}, 'rb') as f:\n"
+        "    index, docstore, ids = pickle.load(f)\n"
+        "index = faiss.deserialize_index(index)\n"
+        "search = lambda q: [docstore.search(ids[i]) for i in index.search(q, 5)[1][0]]\n",
+    ),
+    "snapshot": (
+        "from langchain_community.embeddings import FakeEmbeddings\n"
+        "from vector_snapshot import load_snapshot\n",
+        "store = load_snapshot({path!r}, FakeEmbeddings(size={dim}))\n"
+        "search = lambda q: [store.docstore.search(store.index_to_docstore_id[i]) for i in store.index.search(q, 5)[1][0]]\n",
+    ),
+}
+
+CHILD = """
+import json, os, time
+import numpy as np
+{imports}
+def rss():
+    status = dict(line.split(':', 1) for line in open('/proc/self/status'))
+    return {{kind: int(status['Rss' + kind].split()[0]) * 1024 for kind in ('Anon', 'File')}}
+baseline_rss = rss()
+started = time.perf_counter()
+{loader}
+loaded = time.perf_counter()
+search(np.random.rand(1, {dim}).astype('float32'))
+searched = time.perf_counter()
+final_rss = rss()
+print(json.dumps({{
+    "load_s": loaded - started,
+    "first_search_s": searched - loaded,
+    "anon_growth_mb": (final_rss['Anon'] - baseline_rss['Anon']) / 1024 ** 2,
+    "file_growth_mb": (final_rss['File'] - baseline_rss['File']) / 1024 ** 2,
+}}))
+"""
+
+
+def build_store(vectors: int, dim: int) -> FAISS:
+    index = faiss.IndexFlatL2(dim)
+    for start in range(0, vectors, 10000):
+        index.add(np.random.rand(min(10000, vectors - start), dim).astype("float32"))
+    ids = {i: f"chunk-{i}" for i in range(vectors)}
+    docstore = InMemoryDocstore({
+        doc_id: Document(page_content=f"Synthetic chunk {i} " * 40, metadata={"reference": str(i)})
+        for i, doc_id in ids.items()
+    })
+    return FAISS(FakeEmbeddings(size=dim), index, docstore, ids)
+
+
+def run_loader(name: str, path: str, dim: int) -> dict:
+    imports, loader = LOADERS[name]
+    code = CHILD.format(imports=imports, loader=loader.format(path=path, dim=dim), dim=dim)
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, cwd=os.getcwd())
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f"Building synthetic store: {args.vectors} vectors x {args.dim} dims")
+        store = build_store(args.vectors, args.dim)
+
+        paths = {"pickle": os.path.join(workdir, "vector_store.pkl"), "snapshot": os.path.join(workdir, "vector_store")}
+        with open(paths["pickle"], "wb") as f:
+            pickle.dump((faiss.serialize_index(store.index), store.docstore, store.index_to_docstore_id), f)
+        os.makedirs(paths["snapshot"])
+        save_snapshot(store, paths["snapshot"])
+        del store
+
+        print(f"{'format':<10}{'load (s)':>12}{'first search (s)':>20}{'private (MB)':>15}{'file-backed (MB)':>19}")
+        for name in LOADERS:
+            runs = [run_loader(name, paths[name], args.dim) for _ in range(args.runs)]
+            best = min(runs, key=lambda r: r["load_s"])
+            print(f"{name:<10}{best['load_s']:>12.3f}{best['first_search_s']:>20.4f}{best['anon_growth_mb']:>15.1f}{best['file_growth_mb']:>19.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import re
+import json
+from itertools import zip_longest
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Separator between the section label and the parenthesized labels of a stored path, e.g. "12.1.(1).(a)"
+STORED_PATH_SEPARATOR = re.compile(r"\.(?=\()")
+# A citation in a query: "section 12(1)(a)", "s. 12.1", "subsection 12 (1)", "12.1.a" after a keyword
+CITATION_PATTERN = re.compile(
+    r"(?:\b(?P<keyword>sections?|subsections?|paragraphs?|subparagraphs?|clauses?|ss?\.)\s*)?"
+    r"\b(?P<section>\d+[a-z]?(?:\.[0-9a-z]+)*)"
+    r"(?P<parts>(?:\s*\(\s*[0-9a-z.]+\s*\))*)",
+    re.IGNORECASE,
+)
+PART_PATTERN = re.compile(r"\(\s*([0-9a-z.]+)\s*\)", re.IGNORECASE)
+
+
+def path_segments(path: str) -> Tuple[str, ...]:
+    """
+    Split a stored label path such as "12.1.(1).(a)" into normalized segments ("12.1", "1", "a").
+    """
+    return tuple(part.strip("()").lower() for part in STORED_PATH_SEPARATOR.split(path) if part)
+
+
+def citation_candidates(section: str, parts: str) -> List[Tuple[str, ...]]:
+    """
+    Return the label paths a citation may refer to, most specific section number first.
+    "12.1.a" may mean section 12.1, paragraph a or section 12, subsection 1, paragraph a.
+    """
+    labels = tuple(label.lower() for label in PART_PATTERN.findall(parts))
+    if labels:
+        return [(section.lower(),) + labels]
+    components = section.lower().split(".")
+    return [(".".join(components[:i]),) + tuple(components[i:]) for i in range(len(components), 0, -1)]
+
+
+class _Node:
+    __slots__ = ("children", "ids")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.ids: List[str] = []
+
+
+class CitationIndex:
+    """
+    Trie from normalized provision label paths to the ids of the chunks that cover them.
+
+    A citation found in a query resolves to the chunks of the cited provision followed by
+    those of its sub-provisions, in document order, without any embedding or LLM call.
+    """
+
+    def __init__(self):
+        self.root = _Node()
+        self.doc_paths: Dict[str, List[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self.doc_paths)
+
+    def add(self, doc_ids: Iterable[str], metadatas: Iterable[Dict]):
+        for doc_id, metadata in zip(doc_ids, metadatas):
+            paths = metadata.get('references') or ([metadata['reference']] if metadata.get('reference') else [])
+            self._add_paths(doc_id, paths)
+
+    def _add_paths(self, doc_id: str, paths: List[str]):
+        if doc_id in self.doc_paths:
+            self.remove([doc_id])
+        for path in paths:
+            node = self.root
+            for segment in path_segments(path):
+                node = node.children.setdefault(segment, _Node())
+            node.ids.append(doc_id)
+        self.doc_paths[doc_id] = list(paths)
+
+    def remove(self, doc_ids: Iterable[str]):
+        """
+        Remove chunks from the index, pruning provisions left without chunks so a removed provision
+        no longer resolves (and no longer shadows another reading of a citation).
+        """
+        for doc_id in doc_ids:
+            for path in self.doc_paths.pop(doc_id, []):
+                segments = path_segments(path)
+                nodes = [self.root]
+                for segment in segments:
+                    node = nodes[-1].children.get(segment)
+                    if node is None:
+                        break
+                    nodes.append(node)
+                else:
+                    if doc_id in nodes[-1].ids:
+                        nodes[-1].ids.remove(doc_id)
+                    for parent, segment, node in reversed(list(zip(nodes, segments, nodes[1:]))):
+                        if node.ids or node.children:
+                            break
+                        del parent.children[segment]
+
+    def _find(self, segments: Tuple[str, ...]) -> Optional[_Node]:
+        node = self.root
+        for segment in segments:
+            node = node.children.get(segment)
+            if node is None:
+                return None
+        return node
+
+    def _subtree_ids(self, node: _Node) -> List[str]:
+        ids = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            ids.extend(node.ids)
+            stack.extend(reversed(list(node.children.values())))
+        return list(dict.fromkeys(ids))
+
+    def resolve(self, query: str) -> List[Tuple[str, ...]]:
+        """
+        Return the label paths of the provisions cited in the query that exist in the index.
+        """
+        paths = []
+        for match in CITATION_PATTERN.finditer(query):
+            if not match.group("keyword") and not match.group("parts"):
+                continue
+            for candidate in citation_candidates(match.group("section"), match.group("parts")):
+                node = self._find(candidate)
+                if node is not None and (node.ids or node.children):
+                    paths.append(candidate)
+                    break
+        return list(dict.fromkeys(paths))
+
+    def lookup(self, query: str, k: int = 5) -> List[str]:
+        """
+        Return up to k chunk ids for the provisions cited in the query, or an empty list if it cites none.
+        With several citations, chunks are taken from each provision in turn.
+        """
+        per_citation = [self._subtree_ids(self._find(path)) for path in self.resolve(query)]
+        ids = [doc_id for row in zip_longest(*per_citation) for doc_id in row if doc_id is not None]
+        return list(dict.fromkeys(ids))[:k]
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump({"docs": self.doc_paths}, f)
+
+    @classmethod
+    def load(cls, path: str) -> "CitationIndex":
+        with open(path) as f:
+            data = json.load(f)
+        index = cls()
+        for doc_id, paths in data["docs"].items():
+            index._add_paths(doc_id, paths)
+        return index
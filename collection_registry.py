@@ -0,0 +1,166 @@
+import os
+import re
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from vector_snapshot import CURRENT_FILE, DOCSTORE_FILE, SearchIndex, current_version
+
+# Collection used when a request does not name one
+DEFAULT_COLLECTION = "default"
+# Estimated memory the loaded collections may use before the least recently used ones are evicted
+COLLECTION_MEMORY_BUDGET = int(os.getenv("COLLECTION_MEMORY_BUDGET_MB", "4096")) * 1024 ** 2
+COLLECTION_NAME_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,127}$")
+
+
+def migrate_legacy_snapshot(root: str, name: str = DEFAULT_COLLECTION):
+    """
+    Move snapshots written directly under root, before collections existed, into root/<name>.
+    """
+    if current_version(root) is None:
+        return
+    target = os.path.join(root, name)
+    os.makedirs(target, exist_ok=True)
+    for entry in os.listdir(root):
+        if entry.isdigit() or entry == CURRENT_FILE:
+            os.replace(os.path.join(root, entry), os.path.join(target, entry))
+    logging.info(f"Moved the existing vector store into collection '{name}'")
+
+
+class CollectionRegistry:
+    """
+    Named search indexes, each stored as its own snapshot directory under root/<name> and
+    loaded by calling loader with the collection name.
+
+    Collections are loaded on first use and kept in LRU order. When the estimated memory of the
+    loaded collections exceeds the budget, the least recently used ones are dropped; queries
+    already holding a dropped index finish with it, and the next query loads it again.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        loader: Callable[[str], Optional[SearchIndex]],
+        memory_budget: int = COLLECTION_MEMORY_BUDGET,
+    ):
+        self.root = root
+        self.loader = loader
+        self.memory_budget = memory_budget
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        self._loaded: "OrderedDict[str, Tuple[SearchIndex, int]]" = OrderedDict()
+        self._loading: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def path(self, name: str) -> str:
+        if not COLLECTION_NAME_PATTERN.match(name):
+            raise ValueError(f"Invalid collection name {name!r}: use letters, digits, '.', '_' and '-'")
+        return os.path.join(self.root, name)
+
+    def names(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            name for name in os.listdir(self.root)
+            if os.path.isdir(os.path.join(self.root, name)) and current_version(os.path.join(self.root, name))
+        )
+
+    def cached(self, name: str) -> Optional[SearchIndex]:
+        """
+        Return the collection if it is loaded, without touching the disk.
+        """
+        with self._lock:
+            entry = self._loaded.get(name)
+            if entry is None:
+                return None
+            self._loaded.move_to_end(name)
+            self.hits += 1
+            return entry[0]
+
+    def get(self, name: str) -> Optional[SearchIndex]:
+        """
+        Return the collection, loading it from disk if needed, or None if it does not exist.
+        """
+        self.path(name)
+        index = self.cached(name)
+        if index is not None:
+            return index
+        with self._load_lock(name):
+            # Another request may have loaded it while this one waited
+            return self.cached(name) or self._load(name)
+
+    def reload(self, name: str) -> Optional[SearchIndex]:
+        """
+        Load the current snapshot of a collection from disk and publish it, e.g. after ingestion.
+        """
+        with self._load_lock(name):
+            return self._load(name)
+
+    def _load_lock(self, name: str) -> threading.Lock:
+        with self._lock:
+            return self._loading.setdefault(name, threading.Lock())
+
+    def _load(self, name: str) -> Optional[SearchIndex]:
+        self.path(name)
+        index = self.loader(name)
+        if index is not None:
+            self.loads += 1
+            self.put(name, index)
+        return index
+
+    def put(self, name: str, index: SearchIndex):
+        """
+        Publish a (new version of a) collection, then evict others to stay within the budget.
+        """
+        size = self.estimate_size(name, index)
+        with self._lock:
+            self._loaded[name] = (index, size)
+            self._loaded.move_to_end(name)
+            self._evict()
+        logging.info(f"Collection '{name}' version {index.version} loaded, about {size / 1024 ** 2:.0f} MB")
+
+    def estimate_size(self, name: str, index: SearchIndex) -> int:
+        """
+        Estimate the memory a loaded collection uses from its snapshot files. The docstore is
+        read on demand and does not count.
+        """
+        if index.version is None:
+            return 0
+        path = os.path.join(self.path(name), index.version)
+        return sum(
+            os.path.getsize(os.path.join(path, entry)) for entry in os.listdir(path) if entry != DOCSTORE_FILE
+        )
+
+    def _evict(self):
+        used = sum(size for _, size in self._loaded.values())
+        while used > self.memory_budget and len(self._loaded) > 1:
+            name, (_, size) = self._loaded.popitem(last=False)
+            used -= size
+            self.evictions += 1
+            logging.info(f"Evicted collection '{name}' to stay within the memory budget")
+
+    def loaded_stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Report the vector count and estimated memory of each loaded collection.
+        """
+        with self._lock:
+            loaded = list(self._loaded.items())
+        return {
+            name: {"vectors": index.vectorstore.index.ntotal, "estimated_bytes": size}
+            for name, (index, size) in loaded
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            loaded = {name: size for name, (_, size) in self._loaded.items()}
+        return {
+            "collections": self.names(),
+            "loaded": list(loaded),
+            "estimated_bytes": sum(loaded.values()),
+            "memory_budget_bytes": self.memory_budget,
+            "hits": self.hits,
+            "loads": self.loads,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,126 @@
+import os
+import logging
+from typing import Dict, List, Optional
+
+import tiktoken
+from langchain_core.documents import Document
+
+# Prompt tokens the retrieved excerpts may use in total
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# Tokens of the "Excerpt i (Reference: ...)" header and spacing around each excerpt
+EXCERPT_OVERHEAD_TOKENS = 16
+# Chunks of a section this many characters apart or closer are joined into one span
+MERGE_GAP_CHARS = 2
+
+_encoding = None
+
+
+def encoding() -> tiktoken.Encoding:
+    global _encoding
+    if _encoding is None:
+        _encoding = tiktoken.encoding_for_model("gpt-4")
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    return len(encoding().encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, tokens: int) -> str:
+    return encoding().decode(encoding().encode(text, disallowed_special=())[:tokens])
+
+
+class _Span:
+    __slots__ = ("rank", "start", "end", "text", "references")
+
+    def __init__(self, rank: int, start: int, end: int, text: str, references: List[str]):
+        self.rank = rank
+        self.start = start
+        self.end = end
+        self.text = text
+        self.references = references
+
+    def extend(self, other: "_Span"):
+        """
+        Append a span that starts at or before this one's end (plus the merge gap).
+        """
+        if other.start > self.end:
+            self.text += "\n" + other.text
+        elif other.end > self.end:
+            self.text += other.text[self.end - other.start:]
+        self.end = max(self.end, other.end)
+        self.rank = min(self.rank, other.rank)
+        self.references.extend(r for r in other.references if r not in self.references)
+
+
+def chunk_references(metadata: Dict) -> List[str]:
+    if metadata.get('references'):
+        return list(metadata['references'])
+    return [metadata['reference']] if metadata.get('reference') else []
+
+
+def merge_chunks(excerpts: List[Document]) -> List[Document]:
+    """
+    Drop duplicate chunks and merge chunks of the same section that overlap or touch into one
+    contiguous excerpt, using the section-relative start_index/end_index of each chunk.
+    Excerpts are returned in order of their best-ranked chunk; chunks without offsets stay as they are.
+    """
+    seen = set()
+    spans_by_section: Dict[str, List[_Span]] = {}
+    standalone: List[_Span] = []
+    for rank, excerpt in enumerate(excerpts):
+        if excerpt.page_content in seen:
+            continue
+        seen.add(excerpt.page_content)
+        metadata = excerpt.metadata
+        start, end = metadata.get('start_index'), metadata.get('end_index')
+        span = _Span(rank, start, end, excerpt.page_content, chunk_references(metadata))
+        if metadata.get('section') is None or start is None or end is None:
+            standalone.append(span)
+        else:
+            spans_by_section.setdefault(metadata['section'], []).append(span)
+
+    merged = list(standalone)
+    for spans in spans_by_section.values():
+        spans.sort(key=lambda span: span.start)
+        current = spans[0]
+        for span in spans[1:]:
+            if span.start <= current.end + MERGE_GAP_CHARS:
+                current.extend(span)
+            else:
+                merged.append(current)
+                current = span
+        merged.append(current)
+
+    merged.sort(key=lambda span: span.rank)
+    return [
+        Document(
+            page_content=span.text,
+            metadata={'reference': span.references[0] if span.references else 'No reference available', 'references': span.references},
+        )
+        for span in merged
+    ]
+
+
+def build_context(excerpts: List[Document], budget: Optional[int] = None) -> List[Document]:
+    """
+    Merge the retrieved excerpts and keep, in relevance order, those that fit in the token budget.
+    An excerpt that does not fit is skipped in favour of smaller, lower-ranked ones; if not even
+    the best excerpt fits, it is truncated to the budget so the answer always has some context.
+    """
+    budget = CONTEXT_TOKEN_BUDGET if budget is None else budget
+    merged = merge_chunks(excerpts)
+    selected = []
+    used = 0
+    for excerpt in merged:
+        tokens = count_tokens(excerpt.page_content) + EXCERPT_OVERHEAD_TOKENS
+        if used + tokens <= budget:
+            selected.append(excerpt)
+            used += tokens
+    if not selected and merged:
+        best = merged[0]
+        text = truncate_tokens(best.page_content, max(budget - EXCERPT_OVERHEAD_TOKENS, 0))
+        selected.append(Document(page_content=text, metadata=best.metadata))
+        used = budget
+    logging.info(f"Context built from {len(excerpts)} chunks: {len(selected)} excerpts, about {used} tokens")
+    return selected
@@ -0,0 +1,198 @@
+import os
+import base64
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from stage_cache import StageCache
+
+# Location and size limits of the on-disk embedding cache
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "1000000"))
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(8 * 1024 ** 3)))
+# SQLite limits the number of bound parameters per statement
+SQLITE_BATCH_SIZE = 500
+# Keep the entry and byte totals in cache_stats exact whichever process writes the entries
+STATS_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS embeddings_insert AFTER INSERT ON embeddings BEGIN "
+    "UPDATE cache_stats SET entries = entries + 1, bytes = bytes + LENGTH(NEW.vector); END",
+    "CREATE TRIGGER IF NOT EXISTS embeddings_delete AFTER DELETE ON embeddings BEGIN "
+    "UPDATE cache_stats SET entries = entries - 1, bytes = bytes - LENGTH(OLD.vector); END",
+    "CREATE TRIGGER IF NOT EXISTS embeddings_update AFTER UPDATE OF vector ON embeddings BEGIN "
+    "UPDATE cache_stats SET bytes = bytes - LENGTH(OLD.vector) + LENGTH(NEW.vector); END",
+]
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wrap an embeddings client with a persistent, content-addressed cache.
+
+    Vectors are stored in SQLite keyed by hash(embedding model, text), so unchanged chunks are
+    never sent to the embeddings API twice. The least recently used entries are evicted once
+    the cache grows past its entry or byte limit. Query embeddings go through query_cache when
+    one is given.
+
+    Several processes may write to the same cache file (each server worker's ingestion process,
+    rag-pdf.py), so the entry and byte totals and the LRU clock live in the database. Triggers
+    update the totals in the transaction that changes the entries, and a write reads them while
+    holding SQLite's write lock, so every writer evicts against exact totals.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        path: str = EMBEDDING_CACHE_PATH,
+        max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+        max_bytes: int = EMBEDDING_CACHE_MAX_BYTES,
+        query_cache: Optional[StageCache] = None,
+    ):
+        self.embeddings = embeddings
+        self.query_cache = query_cache
+        self.model = getattr(embeddings, "model", type(embeddings).__name__)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_stats ("
+            "id INTEGER PRIMARY KEY CHECK (id = 0), entries INTEGER NOT NULL, bytes INTEGER NOT NULL, clock INTEGER NOT NULL)"
+        )
+        for trigger in STATS_TRIGGERS:
+            self._conn.execute(trigger)
+        # A cache written before the totals were kept is counted once, under the write lock
+        self._conn.execute("BEGIN IMMEDIATE")
+        self._conn.execute(
+            "INSERT OR IGNORE INTO cache_stats "
+            "SELECT 0, COUNT(*), COALESCE(SUM(LENGTH(vector)), 0), COALESCE(MAX(last_used), 0) FROM embeddings"
+        )
+        self._conn.commit()
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model}\0{text}".encode("utf-8")).hexdigest()
+
+    def _tick(self) -> int:
+        """
+        Advance the shared LRU clock. Being the first write of a transaction, this also takes the
+        database's write lock until the transaction commits.
+        """
+        self._conn.execute("UPDATE cache_stats SET clock = clock + 1")
+        return self._conn.execute("SELECT clock FROM cache_stats").fetchone()[0]
+
+    def _get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), SQLITE_BATCH_SIZE):
+                batch = keys[i:i + SQLITE_BATCH_SIZE]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+            if found:
+                now = self._tick()
+                self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+                self._conn.commit()
+        return found
+
+    def _put_many(self, vectors: Dict[str, List[float]]):
+        rows = [(key, array("f", vector).tobytes()) for key, vector in vectors.items()]
+        with self._lock:
+            now = self._tick()
+            self._conn.executemany(
+                "INSERT INTO embeddings (key, vector, last_used) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET vector = excluded.vector, last_used = excluded.last_used",
+                [(key, blob, now) for key, blob in rows],
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """
+        Delete the least recently used entries past the entry or byte limit.
+        Sizes come from the totals in cache_stats, so only the evicted rows are read, not the whole table.
+        """
+        count, size = self._conn.execute("SELECT entries, bytes FROM cache_stats").fetchone()
+        excess = count - self.max_entries
+        if size > self.max_bytes and count:
+            excess = max(excess, int(count * (size - self.max_bytes) / size) + 1)
+        if excess > 0:
+            evicted = self._conn.execute(
+                "SELECT key FROM embeddings ORDER BY last_used LIMIT ?", (excess,)
+            ).fetchall()
+            self._conn.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+            logging.info(f"Evicted {len(evicted)} entries from the embedding cache")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        vectors = self._get_many(list(set(keys)))
+        missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+
+        self.hits += sum(1 for key in keys if key not in missing)
+        self.misses += len(missing)
+        logging.info(f"Embedding cache: {len(texts) - len(missing)} of {len(texts)} chunks cached, embedding {len(missing)}")
+
+        if missing:
+            computed = dict(zip(missing, self.embeddings.embed_documents(list(missing.values()))))
+            self._put_many(computed)
+            vectors.update(computed)
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.query_cache is None:
+            return self.embeddings.embed_query(text)
+        encoded = self.query_cache.get_or_compute_sync(text, lambda: encode_vector(self.embeddings.embed_query(text)))
+        return decode_vector(encoded)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed many queries through the query cache, sending the uncached ones in one batched request.
+        Query vectors never enter the document cache.
+        """
+        embed_batch = getattr(self.embeddings, "embed_queries", None) or (lambda batch: [self.embeddings.embed_query(t) for t in batch])
+        if self.query_cache is None:
+            return embed_batch(texts)
+        keys = [self.query_cache.key(text) for text in texts]
+        found = {}
+        for key in dict.fromkeys(keys):
+            encoded = self.query_cache.lookup(key)
+            if encoded is not None:
+                found[key] = encoded
+        missing = {key: text for key, text in zip(keys, texts) if key not in found}
+        if missing:
+            started = time.perf_counter()
+            vectors = embed_batch(list(missing.values()))
+            cost = (time.perf_counter() - started) / len(missing)
+            for key, vector in zip(missing, vectors):
+                found[key] = encode_vector(vector)
+                self.query_cache.store(key, found[key], cost)
+        return [decode_vector(found[key]) for key in keys]
+
+
+def encode_vector(vector: List[float]) -> str:
+    """
+    Pack a vector as base64 float32 bytes for the query cache: about 8 KB for 1536 dimensions,
+    against about 49 KB as a list of Python floats, and still JSON-serializable for its disk tier.
+    """
+    return base64.b64encode(array("f", vector).tobytes()).decode("ascii")
+
+
+def decode_vector(encoded: str) -> List[float]:
+    vector = array("f")
+    vector.frombytes(base64.b64decode(encoded))
+    return vector.tolist()
@@ -0,0 +1,145 @@
+import os
+import time
+import random
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+import tiktoken
+from langchain_core.embeddings import Embeddings
+
+from metrics import record_embedding_request
+
+# Provider quota and concurrency of the embedding stage
+EMBEDDING_RPM = int(os.getenv("EMBEDDING_RPM", "3000"))
+EMBEDDING_TPM = int(os.getenv("EMBEDDING_TPM", "1000000"))
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "8"))
+# Upper bounds for a single embeddings request
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", "8000"))
+EMBEDDING_BATCH_MAX_TEXTS = 2048
+EMBEDDING_MAX_RETRIES = 6
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """
+    Return True if the error is an HTTP 429 from the embeddings provider.
+    """
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def retry_after(error: Exception, attempt: int) -> float:
+    """
+    Seconds to wait before retrying a rate-limited request: the provider's Retry-After header
+    if present, otherwise exponential backoff with jitter.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return min(60.0, 2.0 ** attempt) * random.uniform(0.5, 1.0)
+
+
+class RateLimiter:
+    """
+    Sliding one-minute window over request and token budgets shared by all workers.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._lock = threading.Lock()
+        self._window = deque()
+        self._tokens = 0
+
+    def acquire(self, tokens: int):
+        """
+        Block until a request of the given size fits in both budgets, then record it.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._window and self._window[0][0] <= now - 60:
+                    self._tokens -= self._window.popleft()[1]
+                fits_tokens = self._tokens + tokens <= self.tokens_per_minute or not self._window
+                if len(self._window) < self.requests_per_minute and fits_tokens:
+                    self._window.append((now, tokens))
+                    self._tokens += tokens
+                    return
+                wait = self._window[0][0] + 60 - now
+            time.sleep(max(wait, 0.01))
+
+
+class ScheduledEmbeddings(Embeddings):
+    """
+    Embed documents in token-sized batches issued concurrently from a bounded worker pool.
+
+    Every request first reserves its size against the provider's requests-per-minute and
+    tokens-per-minute budgets. A batch that is rate limited anyway backs off and retries on
+    its own worker while the other batches keep going.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        max_workers: int = EMBEDDING_WORKERS,
+        batch_tokens: int = EMBEDDING_BATCH_TOKENS,
+        requests_per_minute: int = EMBEDDING_RPM,
+        tokens_per_minute: int = EMBEDDING_TPM,
+    ):
+        self.embeddings = embeddings
+        self.model = getattr(embeddings, "model", type(embeddings).__name__)
+        self.max_workers = max_workers
+        self.batch_tokens = batch_tokens
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.encoding = tiktoken.get_encoding("cl100k_base")
+
+    def _batches(self, texts: List[str]) -> List[Tuple[int, List[str], int]]:
+        batches = []
+        start, batch_tokens = 0, 0
+        for i, count in enumerate(len(tokens) for tokens in self.encoding.encode_batch(texts, disallowed_special=())):
+            if i > start and (batch_tokens + count > self.batch_tokens or i - start >= EMBEDDING_BATCH_MAX_TEXTS):
+                batches.append((start, texts[start:i], batch_tokens))
+                start, batch_tokens = i, 0
+            batch_tokens += count
+        if start < len(texts):
+            batches.append((start, texts[start:], batch_tokens))
+        return batches
+
+    def _embed_batch(self, batch: Tuple[int, List[str], int], kind: str = "documents") -> Tuple[int, List[List[float]]]:
+        start, texts, tokens = batch
+        for attempt in range(EMBEDDING_MAX_RETRIES + 1):
+            self.limiter.acquire(tokens)
+            try:
+                record_embedding_request(kind, len(texts))
+                return start, self.embeddings.embed_documents(texts)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == EMBEDDING_MAX_RETRIES:
+                    raise
+                delay = retry_after(e, attempt)
+                logging.warning(f"Embedding batch at {start} rate limited, retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def embed_documents(self, texts: List[str], kind: str = "documents") -> List[List[float]]:
+        if not texts:
+            return []
+        batches = self._batches(texts)
+        started = time.perf_counter()
+        vectors = [None] * len(texts)
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as pool:
+            for start, batch_vectors in pool.map(lambda batch: self._embed_batch(batch, kind), batches):
+                vectors[start:start + len(batch_vectors)] = batch_vectors
+        elapsed = time.perf_counter() - started
+        logging.info(f"Embedded {len(texts)} texts in {len(batches)} batches in {elapsed:.2f}s")
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        record_embedding_request("query", 1)
+        return self.embeddings.embed_query(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed many queries in the same batched, rate-limited requests as documents, counted as queries.
+        """
+        return self.embed_documents(texts, kind="query")
@@ -55,7 +55,8 @@ export async function POST(request: Request) {
   const startTime = Date.now();
   try {
     const body = await request.json();
-    const backendUrl = "https://manual-marti-bhaulik-70305df9.koyeb.app/query";
+    const backendUrl =
+      "https://manual-marti-bhaulik-70305df9.koyeb.app/query/stream";
     console.log("Backend URL:", backendUrl);
     console.log("Request Body:", JSON.stringify(body));
 
@@ -67,14 +68,15 @@ export async function POST(request: Request) {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
+          Accept: "text/event-stream",
         },
         body: JSON.stringify(body),
       },
-      60000, // 60 seconds timeout
-      5 // 5 retry attempts
+      60000, // 60 seconds timeout until the stream starts
+      5 // 5 retry attempts, only before any event has been sent
     );
 
-    console.log(`Request completed in ${Date.now() - startTime}ms`);
+    console.log(`Stream opened in ${Date.now() - startTime}ms`);
 
     if (!response.ok) {
       const errorText = await response.text();
@@ -83,8 +85,15 @@ export async function POST(request: Request) {
       );
     }
 
-    const data = await response.json();
-    return NextResponse.json(data);
+    // Pass the event stream through unbuffered so tokens reach the browser as they arrive
+    return new Response(response.body, {
+      headers: {
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        Connection: "keep-alive",
+        "X-Accel-Buffering": "no",
+      },
+    });
   } catch (error) {
     console.error(
       `Error processing query after ${Date.now() - startTime}ms:`,
@@ -29,6 +29,7 @@ import {
 import { motion, AnimatePresence } from "framer-motion";
 import { Textarea } from "@/components/ui/textarea";
 import { Alert, AlertDescription } from "@/components/ui/alert";
+import { streamQuery } from "@/lib/query-stream";
 
 type SearchResult = {
   query: string;
@@ -51,6 +52,7 @@ export function AccountantCopilot() {
   const [results, setResults] = useState<SearchResult[]>([]);
   const [loading, setLoading] = useState(false);
   const [loadingStep, setLoadingStep] = useState<LoadingStep>("reading");
+  const [streamingAnswer, setStreamingAnswer] = useState("");
   const [disclaimerAccepted, setDisclaimerAccepted] = useState(false);
   const [feedback, setFeedback] = useState<("positive" | "negative" | null)[]>(
     []
@@ -90,23 +92,19 @@ export function AccountantCopilot() {
 
       setLoading(true);
       setLoadingStep("reading");
+      setStreamingAnswer("");
       try {
-        const targetUrl =
-          "https://manual-marti-bhaulik-70305df9.koyeb.app/query";
-
-        const response = await fetch(targetUrl, {
-          method: "POST",
-          headers: { "Content-Type": "application/json" },
-          body: JSON.stringify({ query: currentQuery, top_k: 5 }),
-        });
-
-        console.log("Response:", response);
-
-        if (!response.ok) {
-          throw new Error("Network response was not ok");
-        }
-
-        const data = await response.json();
+        const data = await streamQuery(
+          "/api/query",
+          { query: currentQuery, top_k: 5 },
+          {
+            onExcerpts: () => setLoadingStep("referencing"),
+            onToken: (_, answer) => {
+              setLoadingStep("summarizing");
+              setStreamingAnswer(answer);
+            },
+          }
+        );
         const newResult: SearchResult = {
           query: currentQuery,
           answer: data.answer,
@@ -160,6 +158,7 @@ export function AccountantCopilot() {
         alert("Failed to fetch search results. Please try again.");
       } finally {
         setLoading(false);
+        setStreamingAnswer("");
       }
     },
     [disclaimerAccepted, queriesLeft, followUpQueries, mainQuery]
@@ -174,30 +173,20 @@ export function AccountantCopilot() {
 
       setLoading(true);
       setLoadingStep("reading");
+      setStreamingAnswer("");
 
       try {
-        // Simulating API call with timeout
-        await new Promise((resolve) => setTimeout(resolve, 2000));
-        setLoadingStep("referencing");
-        await new Promise((resolve) => setTimeout(resolve, 2000));
-        setLoadingStep("summarizing");
-
-        // TODO: Replace with actual API call
-        const response = await fetch("/api/query", {
-          method: "POST",
-          headers: { "Content-Type": "application/json" },
-          body: JSON.stringify({
-            query: results[index].query,
-            top_k: 5,
-            regenerate: true,
-          }),
-        });
-
-        if (!response.ok) {
-          throw new Error("Network response was not ok");
-        }
-
-        const data = await response.json();
+        const data = await streamQuery(
+          "/api/query",
+          { query: results[index].query, top_k: 5, regenerate: true },
+          {
+            onExcerpts: () => setLoadingStep("referencing"),
+            onToken: (_, answer) => {
+              setLoadingStep("summarizing");
+              setStreamingAnswer(answer);
+            },
+          }
+        );
         const newResult: SearchResult = {
           query: results[index].query,
           answer: data.answer,
@@ -236,6 +225,7 @@ export function AccountantCopilot() {
         alert("Failed to regenerate response. Please try again.");
       } finally {
         setLoading(false);
+        setStreamingAnswer("");
       }
     },
     [queriesLeft, results]
@@ -404,6 +394,13 @@ export function AccountantCopilot() {
           <div className="animate-pulse text-center font-semibold">
             {loadingMessages[loadingStep]}
           </div>
+          {streamingAnswer && (
+            <Card className="mt-4">
+              <CardContent className="pt-6 whitespace-pre-wrap">
+                {streamingAnswer}
+              </CardContent>
+            </Card>
+          )}
         </div>
       )}
 
@@ -0,0 +1,73 @@
+export type Excerpt = {
+  content: string;
+  reference: string;
+};
+
+export type QueryStreamHandlers = {
+  onExcerpts?: (excerpts: Excerpt[]) => void;
+  onToken?: (text: string, answer: string) => void;
+};
+
+/**
+ * POST a query to a server-sent event endpoint and consume its events:
+ * "excerpts" once retrieval is done, "token" for each piece of the answer,
+ * then "done" or "error". Resolves with the full answer and excerpts.
+ */
+export async function streamQuery(
+  url: string,
+  body: unknown,
+  handlers: QueryStreamHandlers = {}
+): Promise<{ answer: string; excerpts: Excerpt[] }> {
+  const response = await fetch(url, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+      Accept: "text/event-stream",
+    },
+    body: JSON.stringify(body),
+  });
+
+  if (!response.ok || !response.body) {
+    throw new Error("Network response was not ok");
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let answer = "";
+  let excerpts: Excerpt[] = [];
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      const raw = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let event = "message";
+      let data = "";
+      for (const line of raw.split("\n")) {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) data += line.slice(5).trim();
+      }
+      const payload = data ? JSON.parse(data) : {};
+
+      if (event === "excerpts") {
+        excerpts = payload.excerpts;
+        handlers.onExcerpts?.(excerpts);
+      } else if (event === "token") {
+        answer += payload.text;
+        handlers.onToken?.(payload.text, answer);
+      } else if (event === "error") {
+        throw new Error(payload.detail || "Failed to process query");
+      } else if (event === "done") {
+        return { answer, excerpts };
+      }
+    }
+  }
+
+  throw new Error("Stream ended before the answer was complete");
+}
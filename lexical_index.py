@@ -0,0 +1,105 @@
+import re
+import json
+import math
+import heapq
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+# BM25 term-frequency saturation and length normalization
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Words too common in the corpus to help ranking; skipping them keeps lookups short
+STOPWORDS = frozenset(
+    "a an and are as at be by does for from how if in is it its of on or that the this to was what when "
+    "where which who with".split()
+)
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase word tokens, dropping stopwords.
+    Statutory labels such as 12(1)(a) become the tokens 12, 1 and a.
+    """
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class LexicalIndex:
+    """
+    In-memory inverted index that ranks chunks with BM25.
+
+    Chunks are keyed by their docstore id, so results resolve through the vector store's
+    docstore and can be fused with vector results. Searching touches only the postings of the
+    query terms and needs no embedding call.
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_terms: Dict[str, Tuple[str, ...]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def add(self, doc_ids: Iterable[str], texts: Iterable[str]):
+        for doc_id, text in zip(doc_ids, texts):
+            self._add_counts(doc_id, Counter(tokenize(text)))
+
+    def _add_counts(self, doc_id: str, counts: Dict[str, int]):
+        if doc_id in self.doc_lengths:
+            self.remove([doc_id])
+        for term, count in counts.items():
+            self.postings.setdefault(term, {})[doc_id] = count
+        self.doc_terms[doc_id] = tuple(counts)
+        self.doc_lengths[doc_id] = sum(counts.values())
+        self.total_length += self.doc_lengths[doc_id]
+
+    def remove(self, doc_ids: Iterable[str]):
+        for doc_id in doc_ids:
+            if doc_id not in self.doc_lengths:
+                continue
+            for term in self.doc_terms.pop(doc_id):
+                postings = self.postings[term]
+                del postings[doc_id]
+                if not postings:
+                    del self.postings[term]
+            self.total_length -= self.doc_lengths.pop(doc_id)
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[str, float]]:
+        """
+        Return up to k (doc id, BM25 score) pairs for the query, best first.
+        """
+        if not self.doc_lengths:
+            return []
+        doc_count = len(self.doc_lengths)
+        average_length = self.total_length / doc_count or 1.0
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, count in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * count * (self.k1 + 1) / (count + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def save(self, path: str):
+        docs = {doc_id: {} for doc_id in self.doc_lengths}
+        for term, postings in self.postings.items():
+            for doc_id, count in postings.items():
+                docs[doc_id][term] = count
+        with open(path, "w") as f:
+            json.dump({"k1": self.k1, "b": self.b, "docs": docs}, f)
+
+    @classmethod
+    def load(cls, path: str) -> "LexicalIndex":
+        with open(path) as f:
+            data = json.load(f)
+        index = cls(k1=data["k1"], b=data["b"])
+        for doc_id, counts in data["docs"].items():
+            index._add_counts(doc_id, counts)
+        return index
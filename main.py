@@ -1,14 +1,43 @@
 import os
 from fastapi import FastAPI, HTTPException, UploadFile, File
-from pydantic import BaseModel
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field
 from dotenv import load_dotenv
-from langchain_openai import OpenAIEmbeddings, OpenAI
-from typing import List, Dict, Optional, Tuple
+from openai import AsyncOpenAI
+import httpx
+from typing import List, Dict, Optional, Tuple, Iterable, Iterator, MutableMapping, Any, AsyncIterator, Callable, Literal
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.embeddings import OpenAIEmbeddings
 from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from embedding_cache import CachedEmbeddings
+from embedding_scheduler import ScheduledEmbeddings
+from vector_snapshot import SearchIndex, save_snapshot, load_search_index
+from lexical_index import LexicalIndex
+from citation_index import CitationIndex
+from collection_registry import DEFAULT_COLLECTION, CollectionRegistry, migrate_legacy_snapshot
+from ann_index import FAISS_INDEX_TYPE, configure_search, enable_reconstruct, convert_index, to_flat
+from stage_cache import StageCache
+from answer_cache import AnswerCache
+from context_builder import build_context
+from rerank import MMR_FETCH_K, MMR_LAMBDA, mmr_rerank
+from metrics import (
+    StageTimer, add_embedding_counts, embedding_counts, observe_stages, record_usage, register_service_collector, stage_timer,
+)
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 import logging
+import faiss
+import numpy as np
 import xml.etree.ElementTree as ET
+import tempfile
+import hashlib
+import json
+import time
+import uuid
+import asyncio
+import multiprocessing
+import textwrap
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from contextlib import asynccontextmanager
 
 
@@ -25,6 +54,14 @@ if not os.getenv("OPENAI_API_KEY"):
 class Query(BaseModel):
     query: str
     top_k: Optional[int] = 5
+    # Opt in to one combined refine+extract call, fusing its results with a search on the query as typed
+    speculative: Optional[bool] = False
+    retrieval: Literal["vector", "lexical", "hybrid"] = "hybrid"
+    collection: str = DEFAULT_COLLECTION
+    # Rerank fetch_k candidates for diversity (maximal marginal relevance) before keeping top_k
+    mmr: bool = False
+    mmr_lambda: float = Field(MMR_LAMBDA, ge=0.0, le=1.0)
+    fetch_k: int = Field(MMR_FETCH_K, ge=1)
 
 class QueryResult(BaseModel):
     content: str
@@ -32,151 +69,655 @@ class QueryResult(BaseModel):
 
 class QueryResponse(BaseModel):
     results: List[QueryResult]
+
+class BatchQuery(BaseModel):
+    queries: List[str]
+    top_k: Optional[int] = 5
+    retrieval: Literal["vector", "lexical", "hybrid"] = "hybrid"
+    collection: str = DEFAULT_COLLECTION
+
+class BatchQueryResponse(BaseModel):
+    results: List[QueryResponse]
+
+class JobStatus(BaseModel):
+    job_id: str
+    mode: str
+    collection: str
+    status: str
+    stage: str
+    sections: int
+    chunks_embedded: int
+    elapsed_seconds: float
+    chunks_per_second: float
+    error: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
     
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-# Global variable to store the vector store
-vectorstore = None
-# Path to save and load the vector store
-VECTOR_STORE_PATH = "vector_store.pkl"
+# Initialize OpenAI client on a shared, pooled HTTP connection
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    timeout=httpx.Timeout(120.0, connect=10.0),
+)
+client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client)
+# Query embedding and FAISS search are blocking, so they run on this pool instead of the event loop
+search_executor = ThreadPoolExecutor(max_workers=int(os.getenv("SEARCH_WORKERS", "16")))
+# Ingestion jobs run in a separate process; their progress lives in a manager-backed dict
+ingestion_executor = None
+job_manager = None
+jobs: Dict[str, MutableMapping] = {}
+job_tasks = set()
+# Directory holding one directory of versioned vector store snapshots per collection
+VECTOR_STORE_DIR = "vector_store"
+# Rank constant for reciprocal rank fusion of result lists
+RRF_K = 60
+# Largest number of queries accepted by /query_results/batch
+BATCH_QUERY_LIMIT = 10000
+# Finished ingestion jobs are reported for this long, and at most this many are kept
+JOB_TTL_SECONDS = float(os.getenv("JOB_TTL_SECONDS", "3600"))
+JOB_HISTORY_LIMIT = int(os.getenv("JOB_HISTORY_LIMIT", "100"))
+# XML elements whose text is indexed, and the subset that carries a Label
+XML_TEXT_TAGS = ['Heading', 'Section', 'Subsection', 'Paragraph', 'Subparagraph', 'Clause', 'Label', 'Text', 'TitleText', 'MarginalNote']
+PROVISION_TAGS = ['Section', 'Subsection', 'Paragraph', 'Subparagraph', 'Clause']
+# Text elements read whole, including inline markup such as defined terms and cross-references
+INLINE_TEXT_TAGS = ['Label', 'Text', 'TitleText', 'MarginalNote']
+# Uploads are copied to disk in blocks of this size
+UPLOAD_BLOCK_SIZE = 1024 * 1024
+# Chunks handed to the embedding scheduler at a time
+EMBEDDING_BATCH_SIZE = 2048
+# Largest chunk in characters; whole provisions are packed up to this size
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
+# Splits single text elements longer than a chunk, without overlap since chunks never cut a provision
+text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=0, add_start_index=True)
 
-def save_vectorstore(vectorstore: FAISS):
+def save_vectorstore(vectorstore: FAISS, lexical: Optional[LexicalIndex] = None, citations: Optional[CitationIndex] = None, collection: str = DEFAULT_COLLECTION) -> str:
     """
-    Save the vector store to disk.
+    Save the vector store and its lexical and citation indexes to disk as a new snapshot version of the collection and return the version.
     """
-    with open(VECTOR_STORE_PATH, "wb") as f:
-        pickle.dump(vectorstore, f)
-    logging.info(f"Vector store saved to {VECTOR_STORE_PATH}")
+    root = os.path.join(VECTOR_STORE_DIR, collection)
+    os.makedirs(root, exist_ok=True)
+    return save_snapshot(vectorstore, root, lexical, citations)
 
-def load_vectorstore() -> Optional[FAISS]:
+def load_vectorstore(collection: str = DEFAULT_COLLECTION, writable: bool = False) -> Optional[SearchIndex]:
     """
-    Load the vector store from disk if it exists.
+    Load the current snapshot of a collection and its lexical and citation indexes from disk if they exist.
+    The index file is mapped in place rather than read into memory unless a writable copy is requested.
     """
-    if os.path.exists(VECTOR_STORE_PATH):
-        with open(VECTOR_STORE_PATH, "rb") as f:
-            vectorstore = pickle.load(f)
-        logging.info(f"Vector store loaded from {VECTOR_STORE_PATH}")
-        return vectorstore
-    return None
+    index = load_search_index(os.path.join(VECTOR_STORE_DIR, collection), embeddings, writable=writable)
+    if index:
+        configure_search(index.vectorstore.index)
+        enable_reconstruct(index.vectorstore.index)
+    return index
 
+# Collections currently served, loaded on first query and evicted under a memory budget
+collections = CollectionRegistry(VECTOR_STORE_DIR, load_vectorstore)
 
+# Memoized pipeline stages; bump a prompt version whenever its prompt changes
+stage_caches = {
+    "refine": StageCache("refine", model="gpt-4", prompt_version="1"),
+    "extract": StageCache("extract", model="gpt-4", prompt_version="1"),
+    "refine_extract": StageCache("refine_extract", model="gpt-4", prompt_version="1"),
+}
+# Generated answers, reused for paraphrased questions that retrieve the same chunks
+answer_cache = AnswerCache()
 
 # Initialize OpenAI embeddings
 try:
-    embeddings = OpenAIEmbeddings()
+    openai_embeddings = OpenAIEmbeddings()
+    stage_caches["query_embedding"] = StageCache("query_embedding", model=openai_embeddings.model, prompt_version="2")
+    embeddings = CachedEmbeddings(ScheduledEmbeddings(openai_embeddings), query_cache=stage_caches["query_embedding"])
     
 except Exception as e:
     logging.error(f"Failed to initialize OpenAI embeddings: {e}")
     raise
 
-def process_xml_file(file_content: str) -> Tuple[str, Dict[str, str]]:
+def process_xml_file(source) -> Iterator[Tuple[int, Tuple[str, ...], str]]:
     """
-    Process the XML content and return its content as plain text along with a reference dictionary.
+    Incrementally parse the XML file and yield (offset, label path, text) segments in document order.
+    The label path is the tuple of labels of the enclosing provisions, outermost first; labels may
+    themselves contain dots (section 12.1), so paths are only joined for display.
+    Offsets are character positions in the newline-joined text of all segments.
+    Text elements include their inline markup (defined terms, cross-references) in document order.
+    Each element is cleared once it has been processed, so memory stays flat regardless of document size.
     """
     try:
-        root = ET.fromstring(file_content)
-        logging.info(f"XML content parsed successfully. Root tag: {root.tag}")
+        open_elements = []
+        # Open inline text elements; their children are kept until the whole text has been read
+        inline_depth = 0
+        labels = []
+        # Text that appears in a provision before its Label (e.g. the MarginalNote)
+        pending = []
+        segment_count = 0
+        offset = 0
+
+        def emit(texts: List[str]) -> Iterator[Tuple[int, Tuple[str, ...], str]]:
+            nonlocal offset, segment_count
+            path = tuple(label for label in labels if label)
+            for text in texts:
+                segment_count += 1
+                logging.debug(f"Added text: {text[:50]}...")
+                yield offset, path, text
+                offset += len(text) + 1
+            texts.clear()
 
-        plain_text = []
-        reference_dict = {}
+        for event, elem in ET.iterparse(source, events=("start", "end")):
+            if event == "start":
+                if not open_elements:
+                    logging.info(f"XML parsing started. Root tag: {elem.tag}")
+                open_elements.append(elem)
+                if elem.tag in INLINE_TEXT_TAGS:
+                    inline_depth += 1
+                if elem.tag in PROVISION_TAGS:
+                    yield from emit(pending)
+                    labels.append(None)
+                continue
 
-        def process_element(elem, path=""):
-            logging.debug(f"Processing element: {elem.tag}")
-            if elem.tag in ['Heading', 'Section', 'Subsection', 'Paragraph', 'Subparagraph', 'Clause', 'Label', 'Text', 'TitleText', 'MarginalNote']:
+            open_elements.pop()
+            if elem.tag in INLINE_TEXT_TAGS:
+                inline_depth -= 1
+            if inline_depth:
+                continue
+            if elem.tag in INLINE_TEXT_TAGS:
+                text = " ".join("".join(elem.itertext()).split())
+            elif elem.tag in XML_TEXT_TAGS:
                 text = elem.text.strip() if elem.text else ""
-                if text:
-                    if elem.tag == 'Label':
-                        new_path = f"{path}{text}."
-                        reference_dict[new_path.rstrip('.')] = new_path.rstrip('.')
-                        logging.debug(f"Added reference: {new_path.rstrip('.')}")
-                    else:
-                        full_text = f"{path}{text}"
-                        plain_text.append(full_text)
-                        logging.debug(f"Added text: {full_text[:50]}...")
-
-            for child in elem:
+            else:
+                text = ""
+            if text:
                 if elem.tag == 'Label':
-                    process_element(child, path + elem.text + ".")
+                    if labels:
+                        labels[-1] = text
+                        logging.debug(f"Added reference: {label_path(labels)}")
+                        yield from emit(pending)
                 else:
-                    process_element(child, path)
+                    pending.append(text)
+                    if not labels or labels[-1] is not None:
+                        yield from emit(pending)
 
-        process_element(root)
-        plain_text = "\n".join(plain_text)
-        
-        logging.info(f"XML processing complete. Plain text length: {len(plain_text)}, References: {len(reference_dict)}")
-        
-        if not plain_text:
-            raise ValueError("No text content extracted from XML")
-        
-        return plain_text, reference_dict
+            if elem.tag in PROVISION_TAGS:
+                yield from emit(pending)
+                labels.pop()
+
+            # Children have already been yielded, so the finished element can be dropped from the tree.
+            elem.clear()
+            if open_elements:
+                open_elements[-1].remove(elem)
+
+        logging.info(f"XML processing complete. Text length: {offset}, Segments: {segment_count}")
     except ET.ParseError as e:
         logging.error(f"XML parsing error: {e}")
         raise HTTPException(status_code=400, detail=f"Invalid XML content: {str(e)}")
-    except ValueError as ve:
-        logging.error(f"Error processing XML content: {ve}")
-        raise HTTPException(status_code=400, detail=str(ve))
-    except Exception as e:
-        logging.error(f"Error processing XML content: {e}")
-        raise HTTPException(status_code=500, detail=f"Error processing XML content: {str(e)}")
-        
-def create_vector_store(text_content: str, reference_dict: Dict[str, str]) -> FAISS:
+
+def label_path(labels: Iterable[Optional[str]]) -> str:
+    """
+    Join the labels of the enclosing provisions into a dotted reference path.
+    """
+    return ".".join(label for label in labels if label)
+
+async def spool_upload(file: UploadFile) -> str:
+    """
+    Copy an uploaded file to a temporary file on disk in fixed-size blocks and return its path.
+    """
+    with tempfile.NamedTemporaryFile(suffix=os.path.splitext(file.filename or "")[1], delete=False) as spool:
+        while True:
+            block = await file.read(UPLOAD_BLOCK_SIZE)
+            if not block:
+                break
+            spool.write(block)
+    logging.info(f"Upload spooled to {spool.name}")
+    return spool.name
+
+def report_progress(progress: Optional[MutableMapping], **values):
+    """
+    Record ingestion progress when running as a background job.
+    """
+    if progress is not None:
+        progress.update(values)
+
+def add_to_vector_store(vectorstore: Optional[FAISS], texts: List[str], metadatas: List[Dict], lexical: Optional[LexicalIndex] = None, citations: Optional[CitationIndex] = None) -> FAISS:
     """
-    Create a vector store from the text content with metadata.
+    Embed a batch of chunks and add it to the vector store, creating the store on the first batch.
+    The chunks are added to the lexical and citation indexes under the same ids when they are given.
+    """
+    ids = [str(uuid.uuid4()) for _ in texts]
+    if vectorstore is None:
+        vectorstore = FAISS.from_texts(texts, embeddings, metadatas=metadatas, ids=ids)
+    else:
+        vectorstore.add_texts(texts, metadatas=metadatas, ids=ids)
+    if lexical is not None:
+        lexical.add(ids, texts)
+    if citations is not None:
+        citations.add(ids, metadatas)
+    return vectorstore
+
+def iter_sections(segments: Iterable[Tuple[int, Tuple[str, ...], str]]) -> Iterator[Tuple[str, List[Tuple[int, Tuple[str, ...], str]]]]:
+    """
+    Group a segment stream into (section key, segments) runs.
+    The key is the top-level section label; text between sections is keyed after the section it follows.
+    """
+    current_key = None
+    previous_section = ""
+    section_segments = []
+
+    for segment in segments:
+        path = segment[1]
+        key = path[0] if path else f"~{previous_section}"
+        if key != current_key:
+            if section_segments:
+                yield current_key, section_segments
+            if path:
+                previous_section = key
+            current_key = key
+            section_segments = []
+        section_segments.append(segment)
+
+    if section_segments:
+        yield current_key, section_segments
+
+def provision_units(segments: List[Tuple[int, Tuple[str, ...], str]], depth: int = 1) -> List[List[Tuple[int, Tuple[str, ...], str]]]:
+    """
+    Split a run of segments into the largest whole provisions that fit in CHUNK_SIZE, descending
+    into sub-provisions (one more label in the path) only where a provision is too long.
+    A provision's own heading and text before its first sub-provision form a unit of their own.
+    """
+    if len(segments) == 1 or segments[-1][0] + len(segments[-1][2]) - segments[0][0] <= CHUNK_SIZE:
+        return [segments]
+    if depth >= max(len(path) for _, path, _ in segments):
+        return [[segment] for segment in segments]
+    units = []
+    group = []
+    for segment in segments:
+        if group and group[-1][1][:depth + 1] != segment[1][:depth + 1]:
+            units.extend(provision_units(group, depth + 1))
+            group = []
+        group.append(segment)
+    units.extend(provision_units(group, depth + 1))
+    return units
+
+def chunk_section(key: str, section_segments: List[Tuple[int, Tuple[str, ...], str]]) -> Tuple[List[str], List[Dict]]:
+    """
+    Split the text of one section into chunks with reference metadata.
+    Whole provisions are packed into chunks of up to CHUNK_SIZE characters without overlap; only a
+    single text element longer than that is split, at paragraph, sentence or word boundaries.
+    Every chunk lists the exact label paths of the provisions it contains and records its section
+    key and a hash of the section text, which update_vector_store uses to detect amended sections.
+    Chunks are built from one top-level section's segments, so they never span two sections.
+    """
+    base_offset = section_segments[0][0]
+    label_paths = []
+    for _, path, _ in section_segments:
+        if path and (not label_paths or label_paths[-1] != label_path(path)):
+            label_paths.append(label_path(path))
+
+    section_text = "\n".join(text for _, _, text in section_segments)
+    section_hash = hashlib.sha256("\n".join(label_paths + [section_text]).encode("utf-8")).hexdigest()
+
+    # (start, end, label paths) spans of whole provisions, or of pieces of an oversized text element
+    spans = []
+    for unit in provision_units(section_segments):
+        start = unit[0][0] - base_offset
+        end = unit[-1][0] + len(unit[-1][2]) - base_offset
+        if end - start <= CHUNK_SIZE:
+            spans.append((start, end, [label_path(path) for path in dict.fromkeys(path for _, path, _ in unit) if path]))
+            continue
+        offset, path, text = unit[0]
+        for piece in text_splitter.create_documents([text]):
+            piece_start = offset - base_offset + piece.metadata['start_index']
+            spans.append((piece_start, piece_start + len(piece.page_content), [label_path(path)] if path else []))
+
+    # Pack consecutive spans into chunks while they fit
+    chunks = []
+    for start, end, paths in spans:
+        if chunks and end - chunks[-1][0] <= CHUNK_SIZE:
+            chunk_start, _, references = chunks[-1]
+            chunks[-1] = (chunk_start, end, references + [path for path in paths if path not in references])
+        else:
+            chunks.append((start, end, paths))
+
+    texts = []
+    metadatas = []
+    for start, end, references in chunks:
+        metadata = {'section': key, 'section_hash': section_hash, 'start_index': start, 'end_index': end}
+        if references:
+            metadata['reference'] = references[0]
+            metadata['references'] = references
+        texts.append(section_text[start:end])
+        metadatas.append(metadata)
+    return texts, metadatas
+
+def iter_section_chunks(segments: Iterable[Tuple[int, Tuple[str, ...], str]]) -> Iterator[Tuple[str, str, List[str], List[Dict]]]:
+    """
+    Yield (section key, section hash, chunk texts, chunk metadatas) for every section in the stream.
+    Repeated section labels (e.g. in schedules) get an occurrence suffix so every key is unique.
+    """
+    occurrences = {}
+    for key, section_segments in iter_sections(segments):
+        occurrences[key] = occurrences.get(key, 0) + 1
+        if occurrences[key] > 1:
+            key = f"{key}#{occurrences[key]}"
+        texts, metadatas = chunk_section(key, section_segments)
+        if texts:
+            yield key, metadatas[0]['section_hash'], texts, metadatas
+
+def create_vector_store(segments: Iterable[Tuple[int, Tuple[str, ...], str]], progress: Optional[MutableMapping] = None, lexical: Optional[LexicalIndex] = None, citations: Optional[CitationIndex] = None, timer: Optional[StageTimer] = None) -> FAISS:
+    """
+    Create a vector store from a stream of (offset, label path, text) segments with metadata.
+    Sections are split and embedded in bounded batches so the full document is never held in memory.
+    Chunks are also added to the lexical and citation indexes when they are given.
+    Once all chunks are embedded, the flat index is converted to the FAISS_INDEX_TYPE index.
+    Time spent chunking and embedding is added to timer when one is given.
     """
     try:
-        logging.info(f"Creating vector store... Text content length: {len(text_content)}")
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        chunks = text_splitter.split_text(text_content)
-        logging.info(f"Text split into {len(chunks)} chunks")
-        
-        if not chunks:
+        logging.info("Creating vector store...")
+        timer = timer or StageTimer()
+        vectorstore = None
+        section_count = 0
+        chunk_count = 0
+        texts = []
+        metadatas = []
+
+        for _, _, section_texts, section_metadatas in timer.iterate("chunk", iter_section_chunks(segments)):
+            texts.extend(section_texts)
+            metadatas.extend(section_metadatas)
+            section_count += 1
+            if len(texts) >= EMBEDDING_BATCH_SIZE:
+                with timer.time("embed"):
+                    vectorstore = add_to_vector_store(vectorstore, texts, metadatas, lexical, citations)
+                chunk_count += len(texts)
+                texts, metadatas = [], []
+            report_progress(progress, sections=section_count, chunks_embedded=chunk_count)
+        if texts:
+            with timer.time("embed"):
+                vectorstore = add_to_vector_store(vectorstore, texts, metadatas, lexical, citations)
+            chunk_count += len(texts)
+        report_progress(progress, sections=section_count, chunks_embedded=chunk_count)
+
+        logging.info(f"Text split into {chunk_count} chunks")
+
+        if vectorstore is None:
             logging.error("No chunks created from the text content")
             raise ValueError("No chunks created from the text content")
-        
-        documents = []
-        current_reference = None
-        
-        for chunk in chunks:
-            metadata = {}
-            for key, value in reference_dict.items():
-                if key in chunk:
-                    current_reference = value
-                    break
-            
-            if current_reference:
-                metadata['reference'] = current_reference
-            
-            documents.append({"content": chunk, "metadata": metadata})
-        
-        logging.info(f"Created {len(documents)} documents")
-        
-        if not documents:
-            logging.error("No documents created")
-            raise ValueError("No documents created")
-        
-        vectorstore = FAISS.from_texts([doc["content"] for doc in documents], embeddings, metadatas=[doc["metadata"] for doc in documents])
+
+        report_progress(progress, stage="training")
+        convert_index(vectorstore, FAISS_INDEX_TYPE)
         logging.info("Vector store created successfully")
         return vectorstore
+    except HTTPException:
+        raise
     except ValueError as ve:
         logging.error(f"ValueError in create_vector_store: {ve}")
         raise HTTPException(status_code=400, detail=str(ve))
     except Exception as e:
         logging.error(f"Error creating vector store: {e}")
         raise HTTPException(status_code=500, detail=f"Error creating vector store: {str(e)}")
-    
-def query_vectorstore(vectorstore: FAISS, query: str, k: int = 5) -> List[Dict]:
+
+def stored_sections(vectorstore: FAISS) -> Dict[str, Tuple[Optional[str], List[str]]]:
+    """
+    Map every section key in the vector store to its stored section hash and chunk ids.
+    """
+    sections = {}
+    for doc_id in vectorstore.index_to_docstore_id.values():
+        metadata = vectorstore.docstore.search(doc_id).metadata
+        section_hash, ids = sections.setdefault(metadata.get('section'), (metadata.get('section_hash'), []))
+        ids.append(doc_id)
+    return sections
+
+def update_vector_store(vectorstore: FAISS, segments: Iterable[Tuple[int, Tuple[str, ...], str]], progress: Optional[MutableMapping] = None, lexical: Optional[LexicalIndex] = None, citations: Optional[CitationIndex] = None, timer: Optional[StageTimer] = None) -> Dict[str, int]:
+    """
+    Apply a new version of the document to an existing vector store and its side indexes.
+    Only sections whose text changed are re-embedded; chunks of changed and removed sections are deleted.
+    ANN indexes are switched to flat for the edit and rebuilt over the updated vectors afterwards.
+    Time spent chunking and embedding is added to timer when one is given.
+    """
+    try:
+        logging.info("Updating vector store...")
+        timer = timer or StageTimer()
+        to_flat(vectorstore)
+        sections = stored_sections(vectorstore)
+        unchanged = set()
+        stale_ids = []
+        texts = []
+        metadatas = []
+        stats = {'unchanged': 0, 'changed': 0, 'added': 0, 'removed': 0, 'chunks_added': 0}
+
+        for key, section_hash, section_texts, section_metadatas in timer.iterate("chunk", iter_section_chunks(segments)):
+            stored = sections.get(key)
+            if stored and stored[0] == section_hash:
+                unchanged.add(key)
+                stats['unchanged'] += 1
+                continue
+            stats['changed' if stored else 'added'] += 1
+            texts.extend(section_texts)
+            metadatas.extend(section_metadatas)
+            report_progress(progress, sections=sum(stats[k] for k in ('unchanged', 'changed', 'added')))
+
+        for key, (_, ids) in sections.items():
+            if key not in unchanged:
+                stale_ids.extend(ids)
+        stats['removed'] = len(sections) - len(unchanged) - stats['changed']
+
+        if stale_ids:
+            vectorstore.delete(stale_ids)
+            if lexical is not None:
+                lexical.remove(stale_ids)
+            if citations is not None:
+                citations.remove(stale_ids)
+        for i in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+            with timer.time("embed"):
+                add_to_vector_store(vectorstore, texts[i:i + EMBEDDING_BATCH_SIZE], metadatas[i:i + EMBEDDING_BATCH_SIZE], lexical, citations)
+            report_progress(progress, chunks_embedded=min(i + EMBEDDING_BATCH_SIZE, len(texts)))
+        stats['chunks_added'] = len(texts)
+        report_progress(progress, stage="training")
+        convert_index(vectorstore, FAISS_INDEX_TYPE)
+
+        logging.info(f"Vector store updated: {stats}, chunks deleted: {len(stale_ids)}")
+        return stats
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error updating vector store: {e}")
+        raise HTTPException(status_code=500, detail=f"Error updating vector store: {str(e)}")
+
+def ingest_xml(xml_path: str, mode: str, progress: Optional[MutableMapping] = None, collection: str = DEFAULT_COLLECTION) -> Dict[str, Any]:
+    """
+    Build or update a collection's vector store from a spooled XML file and save it as a new snapshot.
+    Runs in the ingestion worker process; the server swaps the snapshot in once this returns.
+    The result reports the time spent per stage and the embedding requests made, which the
+    server adds to its metrics since the worker's own are not scraped.
+    """
+    try:
+        report_progress(progress, status="running", stage="indexing", started_at=time.time())
+        timer = StageTimer()
+        embedded_before = embedding_counts()
+        segments = timer.iterate("parse", process_xml_file(xml_path))
+        current = load_vectorstore(collection, writable=True) if mode == "update" else None
+        if current is not None:
+            vectorstore, lexical, citations = current.vectorstore, current.lexical, current.citations
+            sections = update_vector_store(vectorstore, segments, progress, lexical, citations, timer)
+        else:
+            lexical, citations = LexicalIndex(), CitationIndex()
+            vectorstore = create_vector_store(segments, progress, lexical, citations, timer)
+            sections = None
+        report_progress(progress, stage="saving")
+        version = save_vectorstore(vectorstore, lexical, citations, collection)
+        embedded = {key: value - embedded_before[key] for key, value in embedding_counts().items()}
+        return {"version": version, "sections": sections, "stage_seconds": dict(timer.totals), "embedding": embedded}
+    except HTTPException as e:
+        # HTTPException does not survive pickling back to the server process
+        raise RuntimeError(e.detail)
+    finally:
+        os.remove(xml_path)
+
+async def run_ingestion_job(job_id: str, xml_path: str, mode: str, collection: str = DEFAULT_COLLECTION):
+    """
+    Run an ingestion job in the worker process, then atomically swap the collection's new index in.
+    Queries keep using the previous index until the swap.
+    """
+    progress = jobs[job_id]
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(ingestion_executor, ingest_xml, xml_path, mode, progress, collection)
+        observe_stages(result["stage_seconds"])
+        add_embedding_counts(result["embedding"])
+        report_progress(progress, stage="swapping")
+        await loop.run_in_executor(None, collections.reload, collection)
+        report_progress(progress, status="completed", stage="done", finished_at=time.time(), result=result)
+        logging.info(f"Ingestion job {job_id} completed: {result}")
+    except Exception as e:
+        logging.error(f"Ingestion job {job_id} failed: {e}")
+        report_progress(progress, status="failed", finished_at=time.time(), error=str(e))
+    # Keep a plain copy of the final status, releasing the job's dict in the manager process
+    jobs[job_id] = progress.copy()
+    expire_jobs()
+
+def expire_jobs(now: Optional[float] = None):
+    """
+    Forget finished ingestion jobs older than JOB_TTL_SECONDS, and the oldest beyond JOB_HISTORY_LIMIT.
+    """
+    now = now or time.time()
+    finished = sorted(
+        (finished_at, job_id) for job_id, job in list(jobs.items())
+        for finished_at in [job.get("finished_at")] if finished_at is not None
+    )
+    expired = {job_id for finished_at, job_id in finished if now - finished_at > JOB_TTL_SECONDS}
+    expired.update(job_id for _, job_id in finished[:max(len(finished) - JOB_HISTORY_LIMIT, 0)])
+    for job_id in expired:
+        del jobs[job_id]
+    if expired:
+        logging.info(f"Expired {len(expired)} finished ingestion jobs")
+
+def lexical_search(index: SearchIndex, query: str, k: int = 5) -> List[Document]:
+    """
+    Rank chunks by BM25 on the query terms alone; no embedding call is made.
+    """
+    docstore = index.vectorstore.docstore
+    return [docstore.search(doc_id) for doc_id, _ in index.lexical.search(query, k)]
+
+def cited_excerpts(index: SearchIndex, query: str, k: int = 5) -> List[Document]:
+    """
+    Return the chunks of the provisions cited in the query (e.g. "section 12(1)(a)") and their
+    sub-provisions, or an empty list if it cites none. Resolved from memory without network calls.
+    """
+    if index.citations is None:
+        return []
+    docstore = index.vectorstore.docstore
+    return [docstore.search(doc_id) for doc_id in index.citations.lookup(query, k)]
+
+def vector_search_ids(vectorstore: FAISS, vector: np.ndarray, k: int) -> List[str]:
+    """
+    Return the docstore ids of the k chunks nearest to an embedded query.
     """
-    Query the vector store and return results.
+    search_vector = np.array([vector], dtype=np.float32)
+    if vectorstore._normalize_L2:
+        faiss.normalize_L2(search_vector)
+    _, positions = vectorstore.index.search(search_vector, k)
+    return [vectorstore.index_to_docstore_id[p] for p in positions[0] if p != -1]
+
+def diverse_search(index: SearchIndex, query: str, k: int, retrieval: str, mmr_lambda: float, fetch_k: int = MMR_FETCH_K) -> List[Document]:
+    """
+    Retrieve fetch_k candidates and keep the k that best balance relevance and diversity (maximal
+    marginal relevance), so near-identical subsections do not crowd out the rest of the answer.
+    Only the query is embedded; the candidates' vectors are read back from the index.
+    """
+    vectorstore = index.vectorstore
+    fetch_k = max(fetch_k, k)
+    query_vector = np.array(vectorstore.embedding_function.embed_query(query), dtype=np.float32)
+    candidates = []
+    if retrieval != "lexical":
+        candidates.append(vector_search_ids(vectorstore, query_vector, fetch_k))
+    if retrieval != "vector":
+        candidates.append([doc_id for doc_id, _ in index.lexical.search(query, fetch_k)])
+    candidate_ids = fuse_results(candidates, fetch_k, identify=lambda doc_id: doc_id)
+    selected = mmr_rerank(vectorstore, query_vector, candidate_ids, k, mmr_lambda)
+    return [vectorstore.docstore.search(doc_id) for doc_id in selected]
+
+def query_vectorstore(index: SearchIndex, query: str, k: int = 5, retrieval: str = "hybrid", mmr_lambda: Optional[float] = None, fetch_k: int = MMR_FETCH_K) -> List[Dict]:
+    """
+    Query the index and return results.
+    Retrieval is "vector" (embedding similarity), "lexical" (BM25) or "hybrid" (both, fused).
+    With mmr_lambda set, fetch_k candidates are reranked for diversity before keeping k.
     """
     try:
-        logging.info(f"Querying vector store with: {query}")
-        results = vectorstore.similarity_search(query, k=k)
+        logging.info(f"Querying {retrieval} index with: {query}")
+        with stage_timer("search"):
+            if mmr_lambda is not None:
+                results = diverse_search(index, query, k, retrieval, mmr_lambda, fetch_k)
+            elif retrieval == "lexical":
+                results = lexical_search(index, query, k)
+            elif retrieval == "vector":
+                results = index.vectorstore.similarity_search(query, k=k)
+            else:
+                results = fuse_results([index.vectorstore.similarity_search(query, k=k), lexical_search(index, query, k)], k)
         logging.info(f"Query returned {len(results)} results")
         return results
     except Exception as e:
         logging.error(f"Error querying vector store: {e}")
         return []
 
+def batch_query_vectorstore(index: SearchIndex, queries: List[str], k: int = 5, retrieval: str = "hybrid") -> List[List[Document]]:
+    """
+    Retrieve excerpts for many queries, each as /query_results would: cited provisions first, then
+    the chosen retrieval. Queries needing vectors are embedded through the query-embedding cache
+    in one batched call and searched with one matrix search.
+    """
+    logging.info(f"Querying {retrieval} index with a batch of {len(queries)} queries")
+    vectorstore = index.vectorstore
+    results = [cited_excerpts(index, query, k) for query in queries]
+    pending = [i for i, cited in enumerate(results) if not cited]
+
+    vector_results = {}
+    if retrieval != "lexical" and pending:
+        texts = [queries[i] for i in pending]
+        embedding = vectorstore.embedding_function
+        with stage_timer("embed"):
+            if hasattr(embedding, "embed_queries"):
+                vectors = embedding.embed_queries(texts)
+            else:
+                vectors = [embedding.embed_query(text) for text in texts]
+            vectors = np.array(vectors, dtype=np.float32)
+        with stage_timer("search"):
+            if vectorstore._normalize_L2:
+                faiss.normalize_L2(vectors)
+            _, indices = vectorstore.index.search(vectors, k)
+
+        # Look each retrieved chunk up once even when several queries return it
+        documents = {}
+        for position in set(indices.flat) - {-1}:
+            documents[position] = vectorstore.docstore.search(vectorstore.index_to_docstore_id[position])
+        for i, row in zip(pending, indices):
+            vector_results[i] = [documents[position] for position in row if position != -1]
+
+    with stage_timer("search"):
+        for i in pending:
+            if retrieval == "vector":
+                results[i] = vector_results[i]
+            elif retrieval == "lexical":
+                results[i] = lexical_search(index, queries[i], k)
+            else:
+                results[i] = fuse_results([vector_results[i], lexical_search(index, queries[i], k)], k)
+    return results
+
+async def search_vectorstore(index: SearchIndex, query: str, k: int = 5, retrieval: str = "hybrid", mmr_lambda: Optional[float] = None, fetch_k: int = MMR_FETCH_K) -> List[Dict]:
+    """
+    Query the index on the search executor without blocking the event loop.
+    This includes lexical searches: BM25 scoring walks whole postings lists, which are long for common terms.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(search_executor, query_vectorstore, index, query, k, retrieval, mmr_lambda, fetch_k)
+
+def fuse_results(result_lists: List[List[Any]], k: int, identify: Callable[[Any], Any] = lambda result: result.page_content) -> List[Any]:
+    """
+    Merge ranked result lists with reciprocal rank fusion, dropping duplicate chunks.
+    Results are documents, identified by their content, unless another identify function is given.
+    """
+    scores = {}
+    documents = {}
+    for results in result_lists:
+        for rank, result in enumerate(results):
+            key = identify(result)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + rank + 1)
+            documents.setdefault(key, result)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [documents[key] for key in ranked[:k]]
+
 def format_result(result: Dict, index: int) -> str:
     """
     Format a single result for display.
@@ -194,31 +735,36 @@ Reference: {reference}
 {'-' * 80}
 """
 
-def refine_query(query: str) -> str:
+async def refine_query(query: str) -> str:
     """
     Use OpenAI to refine the user's query for optimal vector database search.
     """
     try:
         logging.info(f"Refining query: {query}")
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": (
-                    "You are an AI assistant specializing in optimizing queries for vector database searches in tax documents. "
-                    "Your task is to refine user queries to improve search results. Follow these guidelines:\n"
-                    "1. Identify and focus on key tax-related terms and concepts.\n"
-                    "2. Remove any conversational language or filler words.\n"
-                    "3. Use specific technical terms that are likely to appear in tax documents.\n"
-                    "4. Phrase the query in a way that matches how information might be stated in a formal tax document.\n"
-                    "5. If the original query is vague, make educated guesses about what specific information the user might be looking for.\n"
-                    "6. Limit the refined query to 2-3 sentences maximum for optimal search performance."
-                )},
-                {"role": "user", "content": f"Refine this query for searching a tax document: {query}"}
-            ],
-            max_tokens=150,
-            temperature=0.7
-        )
-        refined_query = response.choices[0].message.content.strip()
+        async def complete():
+            response = await client.chat.completions.create(
+                model="gpt-4",
+                messages=[
+                    {"role": "system", "content": (
+                        "You are an AI assistant specializing in optimizing queries for vector database searches in tax documents. "
+                        "Your task is to refine user queries to improve search results. Follow these guidelines:\n"
+                        "1. Identify and focus on key tax-related terms and concepts.\n"
+                        "2. Remove any conversational language or filler words.\n"
+                        "3. Use specific technical terms that are likely to appear in tax documents.\n"
+                        "4. Phrase the query in a way that matches how information might be stated in a formal tax document.\n"
+                        "5. If the original query is vague, make educated guesses about what specific information the user might be looking for.\n"
+                        "6. Limit the refined query to 2-3 sentences maximum for optimal search performance."
+                    )},
+                    {"role": "user", "content": f"Refine this query for searching a tax document: {query}"}
+                ],
+                max_tokens=150,
+                temperature=0.7
+            )
+            record_usage("refine", response.usage)
+            return response.choices[0].message.content.strip()
+
+        with stage_timer("refine"):
+            refined_query = await stage_caches["refine"].get_or_compute(query, complete)
         logging.info(f"Original query: {query}")
         logging.info(f"Refined query: {refined_query}")
         return refined_query
@@ -226,38 +772,82 @@ def refine_query(query: str) -> str:
         logging.error(f"Error refining query with OpenAI: {e}")
         return query
 
-def extract_search_terms(refined_query: str) -> str:
+async def extract_search_terms(refined_query: str) -> str:
     """
     Extract key search terms from the refined query for vector search.
     """
     try:
         logging.info(f"Extracting search terms from: {refined_query}")
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": (
-                    "You are an AI assistant tasked with extracting key search terms from a refined query. "
-                    "Your goal is to identify the most important words or phrases that will yield the best results in a vector database search. "
-                    "Focus on technical terms, tax-specific concepts, and unique identifiers. "
-                    "Exclude common words and focus on the essence of the query. "
-                    "Return only the key terms, separated by spaces."
-                )},
-                {"role": "user", "content": f"Extract key search terms from this refined query: {refined_query}"}
-            ],
-            max_tokens=50,
-            temperature=0.5
-        )
-        search_terms = response.choices[0].message.content.strip()
+        async def complete():
+            response = await client.chat.completions.create(
+                model="gpt-4",
+                messages=[
+                    {"role": "system", "content": (
+                        "You are an AI assistant tasked with extracting key search terms from a refined query. "
+                        "Your goal is to identify the most important words or phrases that will yield the best results in a vector database search. "
+                        "Focus on technical terms, tax-specific concepts, and unique identifiers. "
+                        "Exclude common words and focus on the essence of the query. "
+                        "Return only the key terms, separated by spaces."
+                    )},
+                    {"role": "user", "content": f"Extract key search terms from this refined query: {refined_query}"}
+                ],
+                max_tokens=50,
+                temperature=0.5
+            )
+            record_usage("extract", response.usage)
+            return response.choices[0].message.content.strip()
+
+        with stage_timer("extract"):
+            search_terms = await stage_caches["extract"].get_or_compute(refined_query, complete)
         logging.info(f"Extracted search terms: {search_terms}")
         return search_terms
     except Exception as e:
         logging.error(f"Error extracting search terms with OpenAI: {e}")
         return refined_query
 
-def openai_generate_answer(excerpts: List[Dict], query: str) -> str:
+async def refine_and_extract(query: str) -> Tuple[str, str]:
     """
-    Use OpenAI to generate an answer based on the retrieved excerpts and the query.
+    Refine the user's query and extract its key search terms with a single OpenAI call.
     """
+    try:
+        logging.info(f"Refining query and extracting search terms: {query}")
+        async def complete():
+            response = await client.chat.completions.create(
+                model="gpt-4",
+                messages=[
+                    {"role": "system", "content": (
+                        "You are an AI assistant specializing in optimizing queries for vector database searches in tax documents. "
+                        "First refine the user's query: focus on key tax-related terms and concepts, remove conversational language, "
+                        "use specific technical terms likely to appear in tax documents, phrase it the way a formal tax document would, "
+                        "and keep it to 2-3 sentences. Then extract the most important search terms from the refined query: "
+                        "technical terms, tax-specific concepts and unique identifiers, separated by spaces. "
+                        'Respond with JSON only, in the form {"refined_query": "...", "search_terms": "..."}.'
+                    )},
+                    {"role": "user", "content": f"Refine this query for searching a tax document: {query}"}
+                ],
+                max_tokens=200,
+                temperature=0.5
+            )
+            record_usage("refine", response.usage)
+            result = json.loads(response.choices[0].message.content)
+            refined_query = result["refined_query"].strip()
+            return [refined_query, result["search_terms"].strip() or refined_query]
+
+        with stage_timer("refine"):
+            refined_query, search_terms = await stage_caches["refine_extract"].get_or_compute(query, complete)
+        logging.info(f"Refined query: {refined_query}")
+        logging.info(f"Extracted search terms: {search_terms}")
+        return refined_query, search_terms
+    except Exception as e:
+        logging.error(f"Error refining query and extracting search terms with OpenAI: {e}")
+        return query, query
+
+def build_answer_messages(excerpts: List[Dict], query: str) -> List[Dict[str, str]]:
+    """
+    Build the chat messages asking OpenAI to answer the query from the retrieved excerpts.
+    Overlapping excerpts are merged and the excerpts are cut to the context token budget first.
+    """
+    excerpts = build_context(excerpts)
     prompt = (
         f"Provide a detailed answer to the following question based on the given excerpts. "
         f"Focus on accuracy and relevant information. "
@@ -278,18 +868,25 @@ def openai_generate_answer(excerpts: List[Dict], query: str) -> str:
         "4. Additional Information (if applicable)\n"
         "5. References (cite the relevant excerpt references)\n"
     )
+    return [
+        {"role": "system", "content": "You are an expert providing accurate and detailed information with relevant examples."},
+        {"role": "user", "content": prompt}
+    ]
 
+async def openai_generate_answer(excerpts: List[Dict], query: str) -> str:
+    """
+    Use OpenAI to generate an answer based on the retrieved excerpts and the query.
+    """
     try:
         logging.info("Generating answer with OpenAI")
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are an expert providing accurate and detailed information with relevant examples."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=1500,
-            temperature=0.2
-        )
+        with stage_timer("generate"):
+            response = await client.chat.completions.create(
+                model="gpt-4",
+                messages=build_answer_messages(excerpts, query),
+                max_tokens=1500,
+                temperature=0.2
+            )
+        record_usage("generate", response.usage)
         answer = response.choices[0].message.content.strip()
         logging.info("Answer generated successfully")
         return answer
@@ -297,7 +894,28 @@ def openai_generate_answer(excerpts: List[Dict], query: str) -> str:
         logging.error(f"Error generating response from OpenAI: {e}")
         return None
 
-def main():
+async def openai_stream_answer(excerpts: List[Dict], query: str) -> AsyncIterator[str]:
+    """
+    Use OpenAI to generate an answer like openai_generate_answer, yielding tokens as they are produced.
+    """
+    logging.info("Streaming answer with OpenAI")
+    with stage_timer("generate"):
+        stream = await client.chat.completions.create(
+            model="gpt-4",
+            messages=build_answer_messages(excerpts, query),
+            max_tokens=1500,
+            temperature=0.2,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        async for chunk in stream:
+            # With include_usage, the last chunk has no choices and reports the token usage
+            record_usage("generate", getattr(chunk, "usage", None))
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    logging.info("Answer streamed successfully")
+
+async def main():
     print("Welcome to the Improved XML Query Interface!")
     print("Please provide the path to your XML file.")
     
@@ -307,15 +925,9 @@ def main():
         print("The specified file does not exist. Please check the path and try again.")
         return
     
-    print("Processing XML file...")
-    text_content, reference_dict = process_xml_file(xml_file_path)
-    
-    if not text_content:
-        print("Failed to process the XML file. Please check the file and try again.")
-        return
-    
-    print("Creating vector store...")
-    vectorstore = create_vector_store(text_content, reference_dict)
+    print("Processing XML file and creating vector store...")
+    lexical, citations = LexicalIndex(), CitationIndex()
+    vectorstore = create_vector_store(process_xml_file(xml_file_path), lexical=lexical, citations=citations)
     
     if not vectorstore:
         print("Failed to create vector store. Please try again.")
@@ -336,14 +948,14 @@ def main():
             continue
         
         print("Refining your query...")
-        refined_query = refine_query(user_query)
+        refined_query = await refine_query(user_query)
         print(f"Refined query: {refined_query}")
         
         print("Extracting key search terms...")
-        search_terms = extract_search_terms(refined_query)
+        search_terms = await extract_search_terms(refined_query)
         print(f"Search terms: {search_terms}")
         
-        results = query_vectorstore(vectorstore, search_terms)
+        results = query_vectorstore(SearchIndex(vectorstore, lexical, citations), search_terms)
         
         if results:
             print("\nRelevant excerpts from the document:")
@@ -351,7 +963,7 @@ def main():
                 print(format_result(result, i))
             
             print("Generating a comprehensive answer...")
-            openai_answer = openai_generate_answer(results, user_query)
+            openai_answer = await openai_generate_answer(results, user_query)
             
             if openai_answer:
                 print("\nGenerated Answer:\n")
@@ -368,58 +980,248 @@ def main():
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    global vectorstore
-    vectorstore = load_vectorstore()
-    if vectorstore:
-        logging.info("Vector store loaded successfully.")
+    global ingestion_executor, job_manager
+    migrate_legacy_snapshot(VECTOR_STORE_DIR)
+    names = collections.names()
+    if names:
+        logging.info(f"Collections available, loaded on first query: {', '.join(names)}")
     else:
         logging.info("No existing vector store found. Please process an XML file.")
+    # Spawn rather than fork: the server holds threads and SQLite connections
+    context = multiprocessing.get_context("spawn")
+    job_manager = context.Manager()
+    ingestion_executor = ProcessPoolExecutor(max_workers=1, mp_context=context)
     yield
+    # Shutdown
+    ingestion_executor.shutdown(cancel_futures=True)
+    job_manager.shutdown()
+    search_executor.shutdown(wait=False)
+    await http_client.aclose()
 
 app = FastAPI(lifespan=lifespan)
 
-@app.post("/process_xml")
-async def process_xml(file: UploadFile = File(...)):
+@app.post("/process_xml", status_code=202)
+async def process_xml(file: UploadFile = File(...), mode: str = "replace", collection: str = DEFAULT_COLLECTION):
     """
-    Process the uploaded XML file and initialize the vector store.
+    Queue the uploaded XML file for ingestion into a collection and return the job id.
+    With mode=update, the file is diffed against the collection's vector store section by section
+    and only new or amended sections are embedded. Progress is available at /jobs/{job_id}.
     """
-    global vectorstore
+    if mode not in ("replace", "update"):
+        raise HTTPException(status_code=400, detail="mode must be 'replace' or 'update'")
     try:
-        content = await file.read()
-        text_content, reference_dict = process_xml_file(content.decode())
-        logging.info(f"XML processed. Text content length: {len(text_content)}, References: {len(reference_dict)}")
-        
-        vectorstore = create_vector_store(text_content, reference_dict)
-        return {"message": "XML processed and vector store initialized successfully"}
+        collections.path(collection)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        xml_path = await spool_upload(file)
+        job_id = uuid.uuid4().hex
+        jobs[job_id] = job_manager.dict(
+            mode=mode, collection=collection, status="queued", stage="queued", sections=0, chunks_embedded=0,
+            started_at=None, finished_at=None, error=None, result=None,
+        )
+        task = asyncio.create_task(run_ingestion_job(job_id, xml_path, mode, collection))
+        job_tasks.add(task)
+        task.add_done_callback(job_tasks.discard)
+        return {"message": "XML queued for processing", "job_id": job_id}
     except HTTPException as e:
         logging.error(f"HTTP exception in process_xml: {e.detail}")
         raise e
     except Exception as e:
         logging.error(f"Unexpected error in process_xml: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing XML file: {str(e)}")
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+async def job_status(job_id: str):
+    """
+    Report the stage, progress and throughput of an ingestion job.
+    Finished jobs are kept for JOB_TTL_SECONDS, up to JOB_HISTORY_LIMIT of them.
+    """
+    expire_jobs()
+    if job_id not in jobs:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    job = jobs[job_id].copy()
+    started_at = job["started_at"]
+    elapsed = ((job["finished_at"] or time.time()) - started_at) if started_at else 0.0
+    return JobStatus(
+        job_id=job_id,
+        mode=job["mode"],
+        collection=job["collection"],
+        status=job["status"],
+        stage=job["stage"],
+        sections=job["sections"],
+        chunks_embedded=job["chunks_embedded"],
+        elapsed_seconds=elapsed,
+        chunks_per_second=job["chunks_embedded"] / elapsed if elapsed else 0.0,
+        error=job["error"],
+        result=job["result"],
+    )
     
+def cache_statistics() -> Dict[str, Dict[str, Any]]:
+    """
+    Collect the hit rates and latency saved by each memoized pipeline stage.
+    """
+    stats = {stage: cache.stats() for stage, cache in stage_caches.items()}
+    stats["answer"] = answer_cache.stats()
+    lookups = embeddings.hits + embeddings.misses
+    stats["chunk_embedding"] = {
+        "hits": embeddings.hits,
+        "misses": embeddings.misses,
+        "hit_rate": embeddings.hits / lookups if lookups else 0.0,
+    }
+    return stats
+
+# Cache and index statistics are read by /metrics at scrape time
+register_service_collector(cache_statistics, collections.loaded_stats)
+
+@app.get("/cache_stats")
+async def cache_stats():
+    """
+    Report hit rates and latency saved by each memoized pipeline stage.
+    """
+    return cache_statistics()
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Expose stage latencies, token and embedding counters, cache and index statistics in Prometheus format.
+    """
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/collections")
+async def list_collections():
+    """
+    List the collections on disk and report which are loaded and their estimated memory.
+    """
+    return collections.stats()
+
+async def get_search_index(collection: str) -> SearchIndex:
+    """
+    Return a collection's search index, loading it off the event loop if it is not in memory.
+    """
+    try:
+        index = collections.cached(collection)
+        if index is None:
+            loop = asyncio.get_running_loop()
+            index = await loop.run_in_executor(None, collections.get, collection)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if index is None:
+        raise HTTPException(status_code=404, detail=f"Collection '{collection}' not found. Please process an XML file first.")
+    return index
+
+async def retrieve_excerpts(query: Query, index: SearchIndex) -> Tuple[Optional[List[Document]], Optional[Dict], Optional[Tuple[np.ndarray, List[str]]]]:
+    """
+    Retrieve the excerpts used to answer the user's query, or the cached answer to a similar question.
+    Returns the excerpts (None on a cache hit), the cached response and the key to cache a new answer under.
+    Queries citing provisions and lexical queries are matched as typed, skipping refinement, embedding
+    and the answer cache. Other queries are searched as typed first; the answer cache is checked with
+    that search, and the query is only refined on a miss.
+    """
+    cited = cited_excerpts(index, query.query, k=query.top_k)
+    if cited:
+        logging.info(f"Query cites provisions, returning {len(cited)} cited chunks")
+        return cited, None, None
+    if query.retrieval == "lexical":
+        return await search_vectorstore(index, query.query, k=query.top_k, retrieval="lexical", **search_options(query)), None, None
+
+    raw_results = await search_vectorstore(index, query.query, k=query.top_k, retrieval=query.retrieval, **search_options(query))
+    cached, key = await lookup_answer(query, index, raw_results)
+    if cached is not None:
+        return None, cached, key
+    return await search_excerpts(query, index, raw_results), None, key
+
+async def search_excerpts(query: Query, index: SearchIndex, raw_results: List[Document]) -> List[Document]:
+    """
+    Refine a query that cites no provision and retrieve its excerpts. raw_results are the excerpts
+    retrieved for the query as typed, which speculative queries fuse with the refined results.
+    """
+    if query.speculative:
+        _, search_terms = await refine_and_extract(query.query)
+        refined_results = await search_vectorstore(index, search_terms, k=query.top_k, retrieval=query.retrieval, **search_options(query))
+        return fuse_results([refined_results, raw_results], query.top_k)
+
+    refined_query = await refine_query(query.query)
+    print(f"Refined query: {refined_query}")
+    
+    print("Extracting key search terms...")
+    search_terms = await extract_search_terms(refined_query)
+    print(f"Search terms: {search_terms}")
+    
+    return await search_vectorstore(index, search_terms, k=query.top_k, retrieval=query.retrieval, **search_options(query))
+
+def search_options(query: Query) -> Dict[str, Any]:
+    """
+    Reranking options of a query for search_vectorstore; diversity reranking is off unless requested.
+    """
+    return {"mmr_lambda": query.mmr_lambda if query.mmr else None, "fetch_k": query.fetch_k}
+
+def excerpt_ids(results: List[Document]) -> List[str]:
+    """
+    Identify excerpts by a digest of their content, so equal excerpts match across index positions.
+    """
+    return [hashlib.sha256(result.page_content.encode("utf-8")).hexdigest() for result in results]
+
+async def lookup_answer(query: Query, index: SearchIndex, raw_results: List[Document]) -> Tuple[Optional[Dict], Optional[Tuple[np.ndarray, List[str]]]]:
+    """
+    Return the cached answer to a similar question whose as-typed search retrieved the same
+    excerpts, if any, and the key to cache a new answer under. The raw query's embedding is
+    already cached by that search, so a hit makes no network call.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+        vector = await loop.run_in_executor(search_executor, index.vectorstore.embedding_function.embed_query, query.query)
+    except Exception as e:
+        logging.warning(f"Could not embed the query for the answer cache: {e}")
+        return None, None
+    key = (np.array(vector, dtype=np.float32), excerpt_ids(raw_results))
+    cached = answer_cache.lookup(query.collection, index.version, *key, settings=answer_settings(query))
+    return cached, key
+
+def answer_settings(query: Query) -> Tuple:
+    """
+    Request options that change the generated answer, so answers are only reused across equal settings.
+    """
+    options = search_options(query)
+    return ("gpt-4", query.retrieval, query.top_k, query.speculative, options["mmr_lambda"], options["fetch_k"] if query.mmr else None)
+
+def excerpt_payload(results: List[Dict]) -> List[Dict[str, str]]:
+    """
+    Convert retrieved documents to the excerpt format returned by the API.
+    """
+    return [
+        {"content": r.page_content, "reference": r.metadata.get('reference', 'No reference available')}
+        for r in results
+    ]
+
+def sse_event(event: str, data: Dict) -> str:
+    """
+    Format a server-sent event with a JSON payload.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @app.post("/query")
 async def query(query: Query):
     """
     Handle user query and return generated answer along with relevant excerpts.
     """
     try:
-        refined_query = refine_query(query.query)
-        print(f"Refined query: {refined_query}")
-        
-        print("Extracting key search terms...")
-        search_terms = extract_search_terms(refined_query)
-        print(f"Search terms: {search_terms}")
-        
-        results = query_vectorstore(vectorstore, search_terms)
-        answer = openai_generate_answer(results, query.query)
-        return {
+        index = await get_search_index(query.collection)
+        results, cached, key = await retrieve_excerpts(query, index)
+        if cached is not None:
+            return cached
+
+        started = time.perf_counter()
+        answer = await openai_generate_answer(results, query.query)
+        response = {
             "answer": answer, 
-            "excerpts": [
-                {"content": r.page_content, "reference": r.metadata.get('reference', 'No reference available')} 
-                for r in results
-            ]
+            "excerpts": excerpt_payload(results)
         }
+        if answer is not None and key is not None:
+            answer_cache.store(
+                query.collection, index.version, *key, response, time.perf_counter() - started, settings=answer_settings(query)
+            )
+        return response
     except HTTPException as e:
         logging.error(f"Query error: {e.detail}")
         raise e
@@ -427,16 +1229,60 @@ async def query(query: Query):
         logging.error(f"Unexpected error in query: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
 
+@app.post("/query/stream")
+async def query_stream(query: Query):
+    """
+    Handle user query as a server-sent event stream: an "excerpts" event with the retrieved
+    excerpts, "token" events as the answer is generated, then "done" (or "error").
+    A cached answer is sent as a single "token" event.
+    """
+    async def events():
+        try:
+            index = await get_search_index(query.collection)
+            results, cached, key = await retrieve_excerpts(query, index)
+            if cached is not None:
+                yield sse_event("excerpts", {"excerpts": cached["excerpts"]})
+                yield sse_event("token", {"text": cached["answer"]})
+                yield sse_event("done", {})
+                return
+
+            response = {"answer": "", "excerpts": excerpt_payload(results)}
+            yield sse_event("excerpts", {"excerpts": response["excerpts"]})
+            started = time.perf_counter()
+            tokens = []
+            async for token in openai_stream_answer(results, query.query):
+                tokens.append(token)
+                yield sse_event("token", {"text": token})
+            if key is not None:
+                response["answer"] = "".join(tokens).strip()
+                answer_cache.store(
+                    query.collection, index.version, *key, response, time.perf_counter() - started, settings=answer_settings(query)
+                )
+            yield sse_event("done", {})
+        except HTTPException as e:
+            logging.error(f"Query stream error: {e.detail}")
+            yield sse_event("error", {"detail": e.detail})
+        except Exception as e:
+            logging.error(f"Unexpected error in query_stream: {e}")
+            yield sse_event("error", {"detail": f"Error processing query: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.post("/query_results", response_model=QueryResponse)
 async def query_results(query: Query):
     """
     Handle user query and return relevant excerpts without generating an answer.
     """
     try:
-        if not vectorstore:
-            raise HTTPException(status_code=500, detail="Vector store not initialized. Please process an XML file first.")
+        index = await get_search_index(query.collection)
         
-        results = query_vectorstore(vectorstore, query.query, k=query.top_k)
+        results = cited_excerpts(index, query.query, k=query.top_k)
+        if not results:
+            results = await search_vectorstore(index, query.query, k=query.top_k, retrieval=query.retrieval, **search_options(query))
         return QueryResponse(
             results=[
                 QueryResult(
@@ -452,6 +1298,40 @@ async def query_results(query: Query):
         logging.error(f"Unexpected error in query_results: {e}")
         raise HTTPException(status_code=500, detail="An unexpected error occurred")
 
+@app.post("/query_results/batch", response_model=BatchQueryResponse)
+async def query_results_batch(batch: BatchQuery):
+    """
+    Return relevant excerpts for many queries at once, without generating answers.
+    Each query gets the excerpts /query_results returns for it; diversity reranking is not supported.
+    """
+    if len(batch.queries) > BATCH_QUERY_LIMIT:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_QUERY_LIMIT} queries are allowed per batch.")
+    if not batch.queries:
+        return BatchQueryResponse(results=[])
+    index = await get_search_index(batch.collection)
+
+    try:
+        loop = asyncio.get_running_loop()
+        batch_results = await loop.run_in_executor(
+            search_executor, batch_query_vectorstore, index, batch.queries, batch.top_k, batch.retrieval
+        )
+    except Exception as e:
+        logging.error(f"Unexpected error in query_results_batch: {e}")
+        raise HTTPException(status_code=500, detail="An unexpected error occurred")
+
+    return BatchQueryResponse(
+        results=[
+            QueryResponse(
+                results=[
+                    QueryResult(
+                        content=r.page_content,
+                        reference=r.metadata.get('reference', 'No reference available')
+                    ) for r in results
+                ]
+            ) for results in batch_results
+        ]
+    )
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,115 @@
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+class _Response(dict):
+    """
+    Dict that also allows attribute access, like the Pinecone client's response objects.
+    """
+
+    def __getattr__(self, name: str) -> Any:
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class InMemoryPineconeIndex:
+    """
+    Local stand-in for a Pinecone index, implementing the upsert, fetch, query, delete and
+    describe_index_stats calls the ingestion pipeline and PineconeVectorStore make.
+
+    Vectors are kept per namespace in memory and queried by exact cosine similarity. Request
+    counters make it possible to check how many calls an ingestion run made.
+    """
+
+    def __init__(self, dimension: Optional[int] = None):
+        self.dimension = dimension
+        self.namespaces: Dict[str, Dict[str, Dict]] = {}
+        self.upsert_calls = 0
+        self.fetch_calls = 0
+        self.query_calls = 0
+        self._lock = threading.Lock()
+
+    def _namespace(self, namespace: Optional[str]) -> Dict[str, Dict]:
+        return self.namespaces.setdefault(namespace or "", {})
+
+    def upsert(self, vectors: Iterable[Any], namespace: Optional[str] = None, **kwargs) -> _Response:
+        records = []
+        for vector in vectors:
+            if isinstance(vector, dict):
+                record = {"id": vector["id"], "values": list(vector["values"]), "metadata": dict(vector.get("metadata") or {})}
+            else:
+                doc_id, values, *metadata = vector
+                record = {"id": doc_id, "values": list(values), "metadata": dict(metadata[0]) if metadata else {}}
+            if self.dimension is not None and len(record["values"]) != self.dimension:
+                raise ValueError(f"Vector dimension {len(record['values'])} does not match the index dimension {self.dimension}")
+            records.append(record)
+        with self._lock:
+            self.upsert_calls += 1
+            store = self._namespace(namespace)
+            for record in records:
+                store[record["id"]] = record
+        return _Response(upserted_count=len(records))
+
+    def fetch(self, ids: List[str], namespace: Optional[str] = None, **kwargs) -> _Response:
+        with self._lock:
+            self.fetch_calls += 1
+            store = self._namespace(namespace)
+            found = {doc_id: _Response(store[doc_id]) for doc_id in ids if doc_id in store}
+        return _Response(vectors=found, namespace=namespace or "")
+
+    def query(
+        self,
+        vector: List[float],
+        top_k: int = 10,
+        namespace: Optional[str] = None,
+        filter: Optional[Dict] = None,
+        include_values: bool = False,
+        include_metadata: bool = False,
+        **kwargs,
+    ) -> _Response:
+        with self._lock:
+            self.query_calls += 1
+            records = [
+                record for record in self._namespace(namespace).values()
+                if not filter or all(record["metadata"].get(key) == value for key, value in filter.items())
+            ]
+        if not records:
+            return _Response(matches=[], namespace=namespace or "")
+
+        matrix = np.array([record["values"] for record in records], dtype=np.float32)
+        query = np.asarray(vector, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+        scores = matrix @ query / np.where(norms == 0, 1, norms)
+        order = np.argsort(-scores)[:top_k]
+        matches = []
+        for position in order:
+            record = records[position]
+            match = _Response(id=record["id"], score=float(scores[position]))
+            if include_values:
+                match["values"] = record["values"]
+            if include_metadata:
+                match["metadata"] = dict(record["metadata"])
+            matches.append(match)
+        return _Response(matches=matches, namespace=namespace or "")
+
+    def delete(self, ids: Optional[List[str]] = None, delete_all: bool = False, namespace: Optional[str] = None, **kwargs):
+        with self._lock:
+            store = self._namespace(namespace)
+            if delete_all:
+                store.clear()
+            for doc_id in ids or []:
+                store.pop(doc_id, None)
+        return {}
+
+    def describe_index_stats(self, **kwargs) -> _Response:
+        with self._lock:
+            counts = {name: _Response(vector_count=len(store)) for name, store in self.namespaces.items()}
+        return _Response(
+            dimension=self.dimension,
+            namespaces=counts,
+            total_vector_count=sum(count.vector_count for count in counts.values()),
+        )
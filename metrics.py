@@ -0,0 +1,143 @@
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List
+
+from prometheus_client import REGISTRY, Counter, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Pipeline stages timed by the stage histogram
+STAGES = ("parse", "chunk", "embed", "search", "refine", "extract", "generate")
+# Latency buckets in seconds, from in-memory lookups up to long generations and ingestion jobs
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_seconds", "Time spent in each pipeline stage, per request or per ingestion job",
+    ["stage"], buckets=STAGE_BUCKETS,
+)
+LLM_TOKENS = Counter("rag_llm_tokens", "Chat completion tokens used, by stage and kind", ["stage", "kind"])
+EMBEDDING_REQUESTS = Counter("rag_embedding_requests", "Requests sent to the embeddings API", ["kind"])
+EMBEDDED_TEXTS = Counter("rag_embedded_texts", "Texts sent to the embeddings API", ["kind"])
+# Export every stage from the first scrape, before it has been observed
+for stage in STAGES:
+    STAGE_SECONDS.labels(stage)
+
+
+def stage_timer(stage: str):
+    """
+    Context manager that observes the duration of its block in the stage histogram.
+    """
+    return STAGE_SECONDS.labels(stage).time()
+
+
+def record_usage(stage: str, usage: Any):
+    """
+    Count the prompt and completion tokens of an OpenAI response's usage, if it reports one.
+    """
+    if usage is None:
+        return
+    LLM_TOKENS.labels(stage, "prompt").inc(usage.prompt_tokens or 0)
+    LLM_TOKENS.labels(stage, "completion").inc(usage.completion_tokens or 0)
+
+
+def record_embedding_request(kind: str, texts: int):
+    EMBEDDING_REQUESTS.labels(kind).inc()
+    EMBEDDED_TEXTS.labels(kind).inc(texts)
+
+
+def embedding_counts(kind: str = "documents") -> Dict[str, float]:
+    """
+    Return this process's embedding request and text counts, e.g. to report an ingestion job's usage.
+    """
+    return {
+        "requests": REGISTRY.get_sample_value("rag_embedding_requests_total", {"kind": kind}) or 0.0,
+        "texts": REGISTRY.get_sample_value("rag_embedded_texts_total", {"kind": kind}) or 0.0,
+    }
+
+
+def add_embedding_counts(counts: Dict[str, float], kind: str = "documents"):
+    EMBEDDING_REQUESTS.labels(kind).inc(counts.get("requests", 0))
+    EMBEDDED_TEXTS.labels(kind).inc(counts.get("texts", 0))
+
+
+class StageTimer:
+    """
+    Accumulate the time a streaming pipeline spends in each stage, for work that runs outside
+    the server process (ingestion jobs) and is reported back as totals.
+
+    Nested stages are exclusive: time spent in an inner stage, such as parsing while the chunker
+    pulls segments, is not counted again for the outer one.
+    """
+
+    def __init__(self):
+        self.totals: Dict[str, float] = defaultdict(float)
+        self._nested: List[float] = []
+
+    @contextmanager
+    def time(self, stage: str):
+        started = time.perf_counter()
+        self._nested.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.totals[stage] += elapsed - self._nested.pop()
+            if self._nested:
+                self._nested[-1] += elapsed
+
+    def iterate(self, stage: str, iterable: Iterable) -> Iterator:
+        """
+        Yield the items of iterable, counting the time spent producing them towards stage.
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.time(stage):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+
+def observe_stages(totals: Dict[str, float]):
+    for stage, seconds in totals.items():
+        STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+class ServiceCollector:
+    """
+    Report values read from the service at scrape time: cache statistics and the size of the
+    loaded indexes, which have no natural point to be pushed from.
+    """
+
+    def __init__(self, cache_stats: Callable[[], Dict[str, Dict]], index_stats: Callable[[], Dict[str, Dict]]):
+        self.cache_stats = cache_stats
+        self.index_stats = index_stats
+
+    def collect(self) -> Iterator:
+        hits = CounterMetricFamily("rag_cache_hits", "Cache hits by cache", labels=["cache"])
+        misses = CounterMetricFamily("rag_cache_misses", "Cache misses by cache", labels=["cache"])
+        saved = CounterMetricFamily("rag_cache_saved_seconds", "Computation time saved by cache hits", labels=["cache"])
+        for cache, stats in self.cache_stats().items():
+            hits.add_metric([cache], stats["hits"])
+            misses.add_metric([cache], stats["misses"])
+            if "saved_seconds" in stats:
+                saved.add_metric([cache], stats["saved_seconds"])
+        yield from (hits, misses, saved)
+
+        vectors = GaugeMetricFamily("rag_index_vectors", "Vectors in each loaded collection", labels=["collection"])
+        memory = GaugeMetricFamily("rag_index_memory_bytes", "Estimated memory of each loaded collection", labels=["collection"])
+        for collection, stats in self.index_stats().items():
+            vectors.add_metric([collection], stats["vectors"])
+            memory.add_metric([collection], stats["estimated_bytes"])
+        yield from (vectors, memory)
+
+    def describe(self) -> List:
+        # Scraping calls back into the service, so do not collect at registration time
+        return []
+
+
+def register_service_collector(cache_stats: Callable[[], Dict[str, Dict]], index_stats: Callable[[], Dict[str, Dict]]) -> ServiceCollector:
+    collector = ServiceCollector(cache_stats, index_stats)
+    REGISTRY.register(collector)
+    return collector
@@ -1,53 +1,16 @@
 import os
-from pypdf import PdfReader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.embeddings import OpenAIEmbeddings
 from dotenv import load_dotenv
 from pinecone import Pinecone, ServerlessSpec
 from langchain_community.vectorstores import Pinecone as PineconeVectorStore
+from pdf_pipeline import index_pdf, pinecone_existing, pinecone_upserter
 
 # Load environment variables and set OpenAI API key
 load_dotenv()
 os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
 
-def extract_text_from_pdf(pdf_path):
-    try:
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PdfReader(file)
-            text = ""
-            for page in pdf_reader.pages:
-                try:
-                    text += page.extract_text() + "\n"
-                except Exception as e:
-                    print(f"Error extracting text from page: {e}")
-            return text
-    except Exception as e:
-        print(f"Error opening PDF file: {e}")
-        return ""
-
-def create_semantic_chunks(text, chunk_size=300, chunk_overlap=100):
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        length_function=len,
-        separators=["\n\n", "\n", " ", ""]
-    )
-    return text_splitter.split_text(text)
-
 def process_and_query_pdf(pdf_path, query, chunk_size=300, chunk_overlap=100, k=5):
     try:
-        # Extract text from PDF
-        print("Extracting text from PDF...")
-        text = extract_text_from_pdf(pdf_path)
-        if not text:
-            raise ValueError("No text extracted from PDF")
-
-        # Create semantic chunks
-        print("Creating semantic chunks...")
-        chunks = create_semantic_chunks(text, chunk_size, chunk_overlap)
-        if not chunks:
-            raise ValueError("No chunks created from text")
-
         # Initialize Pinecone
         print("Initializing Pinecone...")
         pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
@@ -64,16 +27,23 @@ def process_and_query_pdf(pdf_path, query, chunk_size=300, chunk_overlap=100, k=
                     region='us-east-1'  # Choose an appropriate region
                 )
             )
+        index = pc.Index(index_name)
         
         # Initialize embeddings
         embeddings = OpenAIEmbeddings()
 
-        # Create Pinecone vector store
-        print("Creating Pinecone vector store...")
-        vectorstore = PineconeVectorStore.from_texts(chunks, embeddings, index_name=index_name)
+        # Index the PDF; chunks already in the index from an earlier run are skipped
+        print("Indexing PDF in Pinecone...")
+        stats = index_pdf(
+            pdf_path, embeddings, pinecone_upserter(index), existing=pinecone_existing(index),
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+        )
+        if not stats["chunks"] and not stats["already_indexed"]:
+            raise ValueError("No text extracted from PDF")
 
         # Perform similarity search
         print("Performing similarity search...")
+        vectorstore = PineconeVectorStore(index, embeddings, "text")
         results = vectorstore.similarity_search(query, k=k)
 
         return results
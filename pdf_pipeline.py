@@ -0,0 +1,389 @@
+import os
+import time
+import queue
+import hashlib
+import bisect
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from pypdf import PdfReader
+from langchain_core.embeddings import Embeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+# Extraction processes, and pages each one extracts per task
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "25"))
+# Chunk text is split in windows of this many chunks' worth of characters
+CHUNK_WINDOW_CHUNKS = 64
+# Chunks per embedding batch, and batches buffered between pipeline stages
+PIPELINE_BATCH_SIZE = int(os.getenv("PIPELINE_BATCH_SIZE", "256"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))
+# Vectors per Pinecone upsert request, and requests sent concurrently
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "100"))
+UPSERT_WORKERS = int(os.getenv("UPSERT_WORKERS", "4"))
+# Ids per Pinecone fetch request
+FETCH_BATCH_SIZE = 1000
+
+# Marks the end of a pipeline queue
+_END = object()
+
+
+def page_count(pdf_path: str) -> int:
+    with open(pdf_path, 'rb') as file:
+        return len(PdfReader(file).pages)
+
+
+def extract_page_range(pdf_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """
+    Extract pages [start, end) of a PDF and return (1-based page number, text) pairs.
+    A page that cannot be extracted yields empty text so page numbers stay aligned.
+    """
+    pages = []
+    with open(pdf_path, 'rb') as file:
+        reader = PdfReader(file)
+        for number in range(start, end):
+            try:
+                text = reader.pages[number].extract_text() or ""
+            except Exception as e:
+                logging.warning(f"Error extracting text from page {number + 1}: {e}")
+                text = ""
+            pages.append((number + 1, text))
+    return pages
+
+
+def iter_pages(
+    pdf_path: str,
+    workers: int = PDF_WORKERS,
+    pages_per_task: int = PDF_PAGES_PER_TASK,
+    executor: Optional[ProcessPoolExecutor] = None,
+) -> Iterator[Tuple[int, str]]:
+    """
+    Yield (page number, text) for every page in order, extracting page ranges in parallel.
+    At most two tasks per worker are in flight, so memory stays bounded however long the PDF is.
+    """
+    if workers <= 1 and executor is None:
+        with open(pdf_path, 'rb') as file:
+            reader = PdfReader(file)
+            for number, page in enumerate(reader.pages, 1):
+                try:
+                    yield number, page.extract_text() or ""
+                except Exception as e:
+                    logging.warning(f"Error extracting text from page {number}: {e}")
+                    yield number, ""
+        return
+
+    total = page_count(pdf_path)
+    ranges = deque((start, min(start + pages_per_task, total)) for start in range(0, total, pages_per_task))
+
+    # Spawn rather than fork: index_pdf's embed and upsert threads are already running, and a forked
+    # child could inherit a lock (logging, SQLite caches) held by one of them and deadlock
+    pool = executor or ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        in_flight = deque()
+        while ranges or in_flight:
+            while ranges and len(in_flight) < 2 * workers:
+                start, end = ranges.popleft()
+                in_flight.append(pool.submit(extract_page_range, pdf_path, start, end))
+            yield from in_flight.popleft().result()
+    finally:
+        if executor is None:
+            pool.shutdown(cancel_futures=True)
+
+
+def iter_page_chunks(
+    pages: Iterable[Tuple[int, str]],
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200,
+) -> Iterator[Tuple[str, Dict]]:
+    """
+    Split a stream of (page number, text) pages into (chunk text, metadata) pairs.
+
+    Chunks may cross page boundaries; metadata records the first and last page each chunk
+    covers and the chunk's character offset in the document. Text is split a window at a time: chunks ending within chunk_size of the window's
+    end are held back and split again with the following pages, so only one window of text
+    is in memory.
+    """
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+        separators=["\n\n", "\n", " ", ""],
+        add_start_index=True,
+    )
+    window = CHUNK_WINDOW_CHUNKS * chunk_size
+    parts: List[str] = []
+    length = 0
+    # Document offset of the first character of the window
+    base = 0
+    page_offsets: List[int] = []
+    page_numbers: List[int] = []
+
+    def split(final: bool) -> Iterator[Tuple[str, Dict]]:
+        nonlocal parts, length, base, page_offsets, page_numbers
+        text = "".join(parts)
+        keep_from = len(text)
+        for doc in text_splitter.create_documents([text]):
+            start = doc.metadata['start_index']
+            end = start + len(doc.page_content)
+            if not final and end > len(text) - chunk_size:
+                keep_from = start
+                break
+            first = bisect.bisect_right(page_offsets, start) - 1
+            last = bisect.bisect_left(page_offsets, end) - 1
+            yield doc.page_content, {
+                'page': page_numbers[max(first, 0)],
+                'last_page': page_numbers[max(last, 0)],
+                'start_index': base + start,
+            }
+
+        # Carry the unsplit tail, and the pages it starts in, over to the next window
+        first = max(bisect.bisect_right(page_offsets, keep_from) - 1, 0)
+        parts = [text[keep_from:]]
+        length = len(text) - keep_from
+        base += keep_from
+        page_offsets = [max(offset - keep_from, 0) for offset in page_offsets[first:]]
+        page_numbers = page_numbers[first:]
+
+    for number, text in pages:
+        page_offsets.append(length)
+        page_numbers.append(number)
+        parts.append(text + "\n")
+        length += len(text) + 1
+        if length >= window:
+            yield from split(final=False)
+    if length:
+        yield from split(final=True)
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 ** 2), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(doc_hash: str, chunk_size: int, chunk_overlap: int, offset: int) -> str:
+    """
+    Deterministic id of the chunk starting at offset in a document, so re-ingesting the same
+    file with the same chunking produces the same ids. The chunking settings are part of the id
+    because they change which text starts at an offset.
+    """
+    return f"{doc_hash[:32]}-{chunk_size}-{chunk_overlap}-{offset}"
+
+
+def document_id(doc_hash: str, chunk_size: int, chunk_overlap: int) -> str:
+    """
+    Id of the marker record written once every chunk of a document is stored, so a later run
+    with the same chunking can tell the document is indexed without extracting it.
+    """
+    return f"{doc_hash[:32]}-{chunk_size}-{chunk_overlap}-document"
+
+
+def marker_vector(dimension: int) -> List[float]:
+    """
+    Vector stored with a document marker: a unit vector along one axis, which scores close to zero
+    against real embeddings and so does not crowd chunks out of search results.
+    """
+    return [1.0] + [0.0] * (dimension - 1)
+
+
+def pinecone_upserter(
+    index: Any,
+    text_key: str = "text",
+    namespace: Optional[str] = None,
+    batch_size: int = UPSERT_BATCH_SIZE,
+    workers: int = UPSERT_WORKERS,
+) -> Callable:
+    """
+    Return an upsert function writing (ids, texts, vectors, metadatas) batches to a Pinecone index,
+    with the chunk text stored under text_key as PineconeVectorStore expects. Records whose text is
+    None (document markers) are stored without text_key, so PineconeVectorStore skips them in
+    search results. Each batch is sent as requests of batch_size vectors, up to workers of them at a time.
+    """
+    def send(records: List[Dict]):
+        index.upsert(vectors=records, namespace=namespace)
+
+    def upsert(ids: List[str], texts: List[Optional[str]], vectors: List[List[float]], metadatas: List[Dict]):
+        records = [
+            {"id": doc_id, "values": vector, "metadata": metadata if text is None else {**metadata, text_key: text}}
+            for doc_id, text, vector, metadata in zip(ids, texts, vectors, metadatas)
+        ]
+        requests = [records[start:start + batch_size] for start in range(0, len(records), batch_size)]
+        if len(requests) <= 1 or workers <= 1:
+            for request in requests:
+                send(request)
+            return
+        with ThreadPoolExecutor(max_workers=min(workers, len(requests))) as pool:
+            # list() re-raises the first failed request
+            list(pool.map(send, requests))
+    return upsert
+
+
+def pinecone_existing(index: Any, namespace: Optional[str] = None) -> Callable[[List[str]], Set[str]]:
+    """
+    Return a function that tells which of a list of ids are already stored in a Pinecone index.
+    """
+    def existing(ids: List[str]) -> Set[str]:
+        found = set()
+        for start in range(0, len(ids), FETCH_BATCH_SIZE):
+            response = index.fetch(ids=ids[start:start + FETCH_BATCH_SIZE], namespace=namespace)
+            found.update(response.vectors)
+        return found
+    return existing
+
+
+class _Stage(threading.Thread):
+    """
+    Pipeline thread that applies fn to every item of its inbox and passes the results on.
+    Bounded queues between stages provide the backpressure; stop is set on the first error.
+    """
+
+    def __init__(self, name: str, fn: Callable, inbox: queue.Queue, outbox: Optional[queue.Queue], stop: threading.Event):
+        super().__init__(name=name, daemon=True)
+        self.fn = fn
+        self.inbox = inbox
+        self.outbox = outbox
+        self.stop = stop
+        self.error: Optional[BaseException] = None
+
+    def run(self):
+        try:
+            while not self.stop.is_set():
+                try:
+                    item = self.inbox.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is _END:
+                    break
+                result = self.fn(item)
+                if self.outbox is not None:
+                    _put(self.outbox, result, self.stop)
+        except BaseException as e:
+            self.error = e
+            self.stop.set()
+        finally:
+            if self.outbox is not None:
+                _put(self.outbox, _END, self.stop)
+
+
+def _put(target: queue.Queue, item: Any, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            target.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def index_pdf(
+    pdf_path: str,
+    embeddings: Embeddings,
+    upsert: Callable[[List[str], List[str], List[List[float]], List[Dict]], None],
+    existing: Optional[Callable[[List[str]], Set[str]]] = None,
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200,
+    batch_size: int = PIPELINE_BATCH_SIZE,
+    queue_size: int = PIPELINE_QUEUE_SIZE,
+    workers: int = PDF_WORKERS,
+) -> Dict[str, Any]:
+    """
+    Stream a PDF into a vector index: pages -> chunks -> embedding batches -> upserts.
+
+    Page extraction (on worker processes) and chunking run in the calling thread, embedding
+    and upserting each on their own thread, connected by queues holding at most queue_size
+    batches. A slow stage blocks the ones before it, so memory stays bounded by a few batches
+    whatever the size of the PDF, while extraction, embedding and upserts overlap.
+
+    Chunk ids are derived from the file's hash and each chunk's offset. When existing is given,
+    chunks whose ids it reports as already stored are neither embedded nor upserted, so a run that
+    was interrupted resumes where it stopped. Once every chunk is stored a document marker is
+    upserted; a file whose marker existing reports is skipped before extraction, so indexing it
+    again only costs hashing the file and one lookup.
+    """
+    started = time.perf_counter()
+    doc_hash = file_hash(pdf_path)
+    marker_id = document_id(doc_hash, chunk_size, chunk_overlap)
+    stats = {"pages": 0, "chunks": 0, "skipped": 0, "batches": 0, "already_indexed": False}
+    if existing is not None and existing([marker_id]):
+        stats["already_indexed"] = True
+        stats["elapsed_seconds"] = time.perf_counter() - started
+        logging.info(f"{pdf_path} is already indexed, skipping it")
+        return stats
+
+    dimension = []
+    stop = threading.Event()
+    chunk_batches = queue.Queue(maxsize=queue_size)
+    vector_batches = queue.Queue(maxsize=queue_size)
+
+    def embed(batch):
+        ids, texts, metadatas = batch
+        if existing is not None:
+            stored = existing(ids)
+            if stored:
+                stats["skipped"] += len(stored)
+                keep = [i for i, doc_id in enumerate(ids) if doc_id not in stored]
+                ids, texts, metadatas = [ids[i] for i in keep], [texts[i] for i in keep], [metadatas[i] for i in keep]
+        if not ids:
+            return None
+        vectors = embeddings.embed_documents(texts)
+        dimension[:] = [len(vectors[0])]
+        return ids, texts, vectors, metadatas
+
+    def write(batch):
+        if batch is None:
+            return
+        upsert(*batch)
+        stats["batches"] += 1
+        logging.info(f"Indexed {stats['batches']} batches, {stats['pages']} pages read")
+
+    stages = [
+        _Stage("embed", embed, chunk_batches, vector_batches, stop),
+        _Stage("upsert", write, vector_batches, None, stop),
+    ]
+    for stage in stages:
+        stage.start()
+
+    def counted(pages):
+        for page in pages:
+            stats["pages"] += 1
+            yield page
+
+    try:
+        batch = ([], [], [])
+        for text, metadata in iter_page_chunks(counted(iter_pages(pdf_path, workers)), chunk_size, chunk_overlap):
+            if stop.is_set():
+                break
+            batch[0].append(chunk_id(doc_hash, chunk_size, chunk_overlap, metadata['start_index']))
+            batch[1].append(text)
+            batch[2].append(metadata)
+            stats["chunks"] += 1
+            if len(batch[1]) >= batch_size:
+                _put(chunk_batches, batch, stop)
+                batch = ([], [], [])
+        if batch[1]:
+            _put(chunk_batches, batch, stop)
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        _put(chunk_batches, _END, stop)
+        for stage in stages:
+            stage.join()
+
+    for stage in stages:
+        if stage.error is not None:
+            raise stage.error
+    if stats["chunks"]:
+        if not dimension:
+            # Every chunk was already stored by an earlier run; embed once to size the marker
+            dimension.append(len(embeddings.embed_query(os.path.basename(pdf_path))))
+        metadata = {"source": os.path.basename(pdf_path), "pages": stats["pages"], "chunks": stats["chunks"]}
+        upsert([marker_id], [None], [marker_vector(dimension[0])], [metadata])
+    stats["elapsed_seconds"] = time.perf_counter() - started
+    logging.info(f"Indexed {pdf_path}: {stats}")
+    return stats
@@ -1,36 +1,16 @@
 import os
-from pypdf import PdfReader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings
 from dotenv import load_dotenv
 from pinecone import Pinecone, ServerlessSpec
 from langchain_pinecone import PineconeVectorStore
 import textwrap
+from embedding_cache import CachedEmbeddings
+from embedding_scheduler import ScheduledEmbeddings
+from pdf_pipeline import index_pdf, pinecone_existing, pinecone_upserter
 
 # Load environment variables
 load_dotenv()
 
-def extract_text_from_pdf(pdf_path):
-    try:
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PdfReader(file)
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-            return text
-    except Exception as e:
-        print(f"Error extracting text from PDF: {e}")
-        return ""
-
-def create_semantic_chunks(text, chunk_size=1000, chunk_overlap=200):
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        length_function=len,
-        separators=["\n\n", "\n", " ", ""]
-    )
-    return text_splitter.split_text(text)
-
 def initialize_pinecone():
     pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
     index_name = "pdf-embeddings"
@@ -48,25 +28,26 @@ def initialize_pinecone():
     return pc.Index(index_name), index_name
 
 def process_and_index_pdf(pdf_path):
-    print("Extracting text from PDF...")
-    text = extract_text_from_pdf(pdf_path)
-    if not text:
-        raise ValueError("No text extracted from PDF")
-
-    print("Creating semantic chunks...")
-    chunks = create_semantic_chunks(text)
-    if not chunks:
-        raise ValueError("No chunks created from text")
-
     print("Initializing Pinecone...")
     index, index_name = initialize_pinecone()
-    
-    print("Creating embeddings and indexing in Pinecone...")
-    embeddings = OpenAIEmbeddings()
-    vectorstore = PineconeVectorStore.from_texts(chunks, embeddings, index_name=index_name)
-    
-    print("Indexing complete.")
-    return vectorstore
+
+    # Pages are extracted, chunked, embedded and upserted as a stream, so only a few
+    # batches of chunks are in memory however large the PDF is. Chunks already in the
+    # index are skipped, so re-indexing the same file does not embed or upsert anything.
+    print("Extracting, embedding and indexing the PDF in Pinecone...")
+    embeddings = CachedEmbeddings(ScheduledEmbeddings(OpenAIEmbeddings()))
+    stats = index_pdf(
+        pdf_path, embeddings, pinecone_upserter(index), existing=pinecone_existing(index),
+        chunk_size=1000, chunk_overlap=200,
+    )
+    if not stats["chunks"] and not stats["already_indexed"]:
+        raise ValueError("No text extracted from PDF")
+
+    if stats["already_indexed"]:
+        print("The PDF is already indexed.")
+    else:
+        print(f"Indexing complete: {stats['pages']} pages, {stats['chunks']} chunks, {stats['skipped']} already indexed.")
+    return PineconeVectorStore(index=index, embedding=embeddings, text_key="text")
 
 def query_vectorstore(vectorstore, query, k=5):
     """
@@ -0,0 +1,69 @@
+import os
+from typing import Dict, List
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+
+# Default trade-off between relevance (1.0) and diversity (0.0), and candidates fetched per result
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.5"))
+MMR_FETCH_K = int(os.getenv("MMR_FETCH_K", "20"))
+
+
+def mmr_select(query_vector: np.ndarray, vectors: np.ndarray, k: int, lambda_mult: float = MMR_LAMBDA) -> List[int]:
+    """
+    Pick k rows of vectors by maximal marginal relevance: each pick maximizes
+    lambda * sim(query, v) - (1 - lambda) * max sim(v, already picked), with cosine similarity.
+    Returns row indexes in pick order.
+    """
+    if not len(vectors) or k <= 0:
+        return []
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    query_vector = query_vector / max(np.linalg.norm(query_vector), 1e-12)
+    relevance = vectors @ query_vector
+    similarity = vectors @ vectors.T
+
+    selected = [int(np.argmax(relevance))]
+    redundancy = similarity[selected[0]].copy()
+    while len(selected) < min(k, len(vectors)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        pick = int(np.argmax(scores))
+        selected.append(pick)
+        np.maximum(redundancy, similarity[pick], out=redundancy)
+    return selected
+
+
+def doc_positions(vectorstore: FAISS, doc_ids: List[str]) -> Dict[str, int]:
+    """
+    Map docstore ids to their positions in the vector store's FAISS index.
+    """
+    id_map = vectorstore.index_to_docstore_id
+    if hasattr(id_map, "positions"):
+        return id_map.positions(doc_ids)
+    wanted = set(doc_ids)
+    return {doc_id: position for position, doc_id in id_map.items() if doc_id in wanted}
+
+
+def mmr_rerank(
+    vectorstore: FAISS,
+    query_vector: np.ndarray,
+    doc_ids: List[str],
+    k: int,
+    lambda_mult: float = MMR_LAMBDA,
+) -> List[str]:
+    """
+    Rerank candidate chunk ids by maximal marginal relevance and return the best k.
+    Candidate vectors are read back from the FAISS index rather than re-embedded; quantized
+    indexes give their approximate vectors, which is enough to tell near-duplicates apart.
+    """
+    positions = doc_positions(vectorstore, doc_ids)
+    doc_ids = [doc_id for doc_id in doc_ids if doc_id in positions]
+    if len(doc_ids) <= 1:
+        return doc_ids[:k]
+    vectors = vectorstore.index.reconstruct_batch(np.array([positions[doc_id] for doc_id in doc_ids], dtype=np.int64))
+    query_vector = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+    if vectorstore._normalize_L2:
+        query_vector = query_vector.copy()
+        faiss.normalize_L2(query_vector.reshape(1, -1))
+    return [doc_ids[row] for row in mmr_select(query_vector, vectors, k, lambda_mult)]
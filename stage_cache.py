@@ -0,0 +1,152 @@
+import os
+import re
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+# Defaults for the in-process tier, and the optional on-disk tier shared by all workers
+STAGE_CACHE_MAX_ENTRIES = int(os.getenv("STAGE_CACHE_MAX_ENTRIES", "4096"))
+STAGE_CACHE_TTL_SECONDS = float(os.getenv("STAGE_CACHE_TTL_SECONDS", str(24 * 3600)))
+STAGE_CACHE_PATH = os.getenv("STAGE_CACHE_PATH")
+
+
+def normalize(text: str) -> str:
+    """
+    Normalize an input so trivially different phrasings share a cache entry.
+    """
+    return re.sub(r"\s+", " ", text).strip().rstrip("?.!").strip().lower()
+
+
+class StageCache:
+    """
+    Memoize one pipeline stage, keyed by normalized input, model and prompt version.
+
+    Entries live in an in-process LRU with a TTL and, when a path is configured, in a SQLite
+    file shared by every worker. Values must be JSON-serializable. Hits, misses and the time
+    the original computations took are tracked so each stage can report latency saved.
+    """
+
+    def __init__(
+        self,
+        stage: str,
+        model: str,
+        prompt_version: str,
+        max_entries: int = STAGE_CACHE_MAX_ENTRIES,
+        ttl: float = STAGE_CACHE_TTL_SECONDS,
+        path: Optional[str] = STAGE_CACHE_PATH,
+    ):
+        self.stage = stage
+        self.model = model
+        self.prompt_version = prompt_version
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._entries: "OrderedDict[str, Tuple[Any, float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS stage_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, cost REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def key(self, text: str) -> str:
+        raw = "\0".join([self.stage, self.model, self.prompt_version, normalize(text)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def lookup(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.saved_seconds += entry[1]
+                return entry[0]
+            self._entries.pop(key, None)
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT value, cost, expires_at FROM stage_cache WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+                if row is not None:
+                    value = json.loads(row[0])
+                    self._remember(key, value, row[1], row[2])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    self.saved_seconds += row[1]
+                    return value
+
+            self.misses += 1
+            return None
+
+    def store(self, key: str, value: Any, cost: float):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, value, cost, expires_at)
+            if self._conn is not None:
+                try:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO stage_cache (key, value, cost, expires_at) VALUES (?, ?, ?, ?)",
+                        (key, json.dumps(value), cost, expires_at),
+                    )
+                    self._conn.commit()
+                except sqlite3.Error as e:
+                    logging.warning(f"Could not persist {self.stage} cache entry: {e}")
+
+    def _remember(self, key: str, value: Any, cost: float, expires_at: float):
+        self._entries[key] = (value, cost, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_compute(self, text: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Return the cached value for text, or await compute() and cache its result.
+        Exceptions from compute() propagate and nothing is cached.
+        """
+        key = self.key(text)
+        value = self.lookup(key)
+        if value is not None:
+            logging.debug(f"{self.stage} cache hit")
+            return value
+        started = time.perf_counter()
+        value = await compute()
+        self.store(key, value, time.perf_counter() - started)
+        return value
+
+    def get_or_compute_sync(self, text: str, compute: Callable[[], Any]) -> Any:
+        """
+        Blocking counterpart of get_or_compute for stages that run on worker threads.
+        """
+        key = self.key(text)
+        value = self.lookup(key)
+        if value is not None:
+            logging.debug(f"{self.stage} cache hit")
+            return value
+        started = time.perf_counter()
+        value = compute()
+        self.store(key, value, time.perf_counter() - started)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "saved_seconds": round(self.saved_seconds, 3),
+            "entries": len(self._entries),
+        }
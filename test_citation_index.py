@@ -0,0 +1,56 @@
+from citation_index import CitationIndex
+
+
+def index_of(*paths):
+    """
+    Index one chunk per label path, with the path as the chunk id.
+    """
+    index = CitationIndex()
+    index.add(list(paths), [{"reference": path} for path in paths])
+    return index
+
+
+def test_decimal_section_is_not_its_parent():
+    index = index_of("12", "12.(1)", "12.1", "12.1.(1)")
+
+    assert index.resolve("section 12") == [("12",)]
+    assert index.resolve("section 12.1") == [("12.1",)]
+    assert index.lookup("section 12") == ["12", "12.(1)"]
+    assert index.lookup("section 12.1") == ["12.1", "12.1.(1)"]
+
+
+def test_dotted_citation_prefers_the_longest_section_number():
+    index = index_of("12.(1).(a)", "12.1.(a)")
+
+    assert index.resolve("section 12.1.a") == [("12.1", "a")]
+    assert index.resolve("section 12(1)(a)") == [("12", "1", "a")]
+
+
+def test_dotted_citation_falls_back_to_subsection_labels():
+    index = index_of("12", "12.(1)", "12.(1).(a)")
+
+    assert index.resolve("section 12.1.a") == [("12", "1", "a")]
+    assert index.lookup("section 12.1.a") == ["12.(1).(a)"]
+
+
+def test_unknown_and_bare_numbers_do_not_resolve():
+    index = index_of("12", "12.(1)")
+
+    assert index.resolve("section 99") == []
+    assert index.resolve("what is the rate in 12") == []
+    assert index.lookup("section 99") == []
+
+
+def test_removed_provisions_stop_resolving():
+    index = index_of("12.(1).(a)", "12.1.(a)")
+    index.remove(["12.1.(a)"])
+
+    assert index.resolve("section 12.1") == [("12", "1")]
+    assert index.resolve("section 12.1.a") == [("12", "1", "a")]
+    assert index.lookup("section 12.1.a") == ["12.(1).(a)"]
+
+
+def test_several_citations_take_chunks_in_turn():
+    index = index_of("1", "1.(1)", "1.(2)", "2", "2.(1)")
+
+    assert index.lookup("compare section 1 and section 2", k=4) == ["1", "2", "1.(1)", "2.(1)"]
@@ -0,0 +1,178 @@
+import io
+import os
+import hashlib
+import tempfile
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("EMBEDDING_CACHE_PATH", os.path.join(tempfile.mkdtemp(), "embedding_cache.sqlite"))
+
+from langchain_core.embeddings import Embeddings
+
+import main
+from citation_index import CitationIndex
+from lexical_index import LexicalIndex
+
+
+class CountingEmbeddings(Embeddings):
+    """
+    Deterministic embeddings that record the texts they are asked to embed.
+    """
+
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+    def _vector(self, text):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [byte / 255 for byte in digest[:8]]
+
+
+def subsection(label, text):
+    return f"<Subsection><Label>({label})</Label><Text>{text}</Text></Subsection>"
+
+
+def section(label, body, note=None):
+    marginal_note = f"<MarginalNote>{note}</MarginalNote>" if note else ""
+    return f"<Section>{marginal_note}<Label>{label}</Label>{body}</Section>"
+
+
+def statute(*sections):
+    return ("<Statute><Body>" + "".join(sections) + "</Body></Statute>").encode("utf-8")
+
+
+def segments(xml):
+    return list(main.process_xml_file(io.BytesIO(xml)))
+
+
+def section_chunks(xml):
+    return {key: (texts, metadatas) for key, _, texts, metadatas in main.iter_section_chunks(segments(xml))}
+
+
+LONG_SECTION = section("13", "".join(subsection(i, f"Rule {i} of a long section. " * 12) for i in range(1, 8)))
+OVERSIZED_SECTION = section("14", subsection(1, "Word " * 500))
+
+
+def test_decimal_sections_are_chunked_separately():
+    chunks = section_chunks(statute(
+        section("12", subsection(1, "Short rule one.") + subsection(2, "Short rule two."), note="Rates"),
+        section("12.1", subsection(1, "Decimal rule.")),
+    ))
+
+    assert list(chunks) == ["12", "12.1"]
+    texts, metadatas = chunks["12"]
+    assert texts == ["Rates\nShort rule one.\nShort rule two."]
+    assert metadatas[0]["references"] == ["12", "12.(1)", "12.(2)"]
+    assert metadatas[0]["reference"] == "12"
+    assert chunks["12.1"][1][0]["references"] == ["12.1.(1)"]
+
+
+def test_chunks_pack_whole_provisions_up_to_the_chunk_size():
+    texts, metadatas = section_chunks(statute(LONG_SECTION))["13"]
+
+    assert all(len(text) <= main.CHUNK_SIZE for text in texts)
+    assert [metadata["references"] for metadata in metadatas] == [
+        ["13.(1)", "13.(2)", "13.(3)"], ["13.(4)", "13.(5)", "13.(6)"], ["13.(7)"],
+    ]
+    # No subsection is cut: each one's text sits whole inside a single chunk
+    for i in range(1, 8):
+        assert sum((f"Rule {i} of a long section. " * 12).strip() in text for text in texts) == 1
+
+
+def test_oversized_text_is_split_within_its_provision():
+    texts, metadatas = section_chunks(statute(OVERSIZED_SECTION))["14"]
+
+    assert len(texts) > 1
+    assert all(len(text) <= main.CHUNK_SIZE for text in texts)
+    assert all(metadata["references"] == ["14.(1)"] for metadata in metadatas)
+
+
+def test_chunks_are_exact_slices_covering_the_section_text():
+    for key, section_segments in main.iter_sections(segments(statute(LONG_SECTION, OVERSIZED_SECTION))):
+        section_text = "\n".join(text for _, _, text in section_segments)
+        texts, metadatas = main.chunk_section(key, section_segments)
+
+        covered = set()
+        for text, metadata in zip(texts, metadatas):
+            assert section_text[metadata["start_index"]:metadata["end_index"]] == text
+            covered.update(range(metadata["start_index"], metadata["end_index"]))
+        # Only the whitespace between provisions and between split pieces may fall outside a chunk
+        assert all(section_text[i].isspace() for i in set(range(len(section_text))) - covered)
+
+
+def test_provision_units_descend_only_into_provisions_that_do_not_fit():
+    short = segments(statute(section("12", subsection(1, "One.") + subsection(2, "Two."), note="Rates")))
+    assert main.provision_units(short) == [short]
+
+    long = segments(statute(LONG_SECTION))
+    units = main.provision_units(long)
+    assert [[path for _, path, _ in unit] for unit in units] == [[("13", f"({i})")] for i in range(1, 8)]
+
+
+def test_provision_units_split_a_long_subsection_into_paragraphs():
+    def paragraph(label, text):
+        return f"<Paragraph><Label>({label})</Label><Text>{text}</Text></Paragraph>"
+
+    nested = segments(statute(section("15", (
+        "<Subsection><Label>(1)</Label>" + paragraph("a", "First.") + paragraph("b", "Second.") + "</Subsection>"
+        + "<Subsection><Label>(2)</Label>" + "".join(paragraph(label, f"Paragraph {label}. " * 30) for label in "abcd") + "</Subsection>"
+    ))))
+    units = main.provision_units(nested)
+    assert [sorted({path for _, path, _ in unit}) for unit in units] == [
+        [("15", "(1)", "(a)"), ("15", "(1)", "(b)")],
+        [("15", "(2)", "(a)")], [("15", "(2)", "(b)")], [("15", "(2)", "(c)")], [("15", "(2)", "(d)")],
+    ]
+
+
+def stored_chunks(vectorstore):
+    documents = [vectorstore.docstore.search(doc_id) for doc_id in vectorstore.index_to_docstore_id.values()]
+    return sorted((document.metadata["section"], document.page_content) for document in documents)
+
+
+def test_update_re_embeds_only_changed_and_added_sections(monkeypatch):
+    embeddings = CountingEmbeddings()
+    monkeypatch.setattr(main, "embeddings", embeddings)
+    original = statute(
+        section("1", subsection(1, "Unchanged one.")),
+        section("2", subsection(1, "Original two.")),
+        section("3", subsection(1, "Removed three.")),
+        section("12", subsection(1, "Unchanged twelve.")),
+        section("12.1", subsection(1, "Original twelve point one.")),
+    )
+    amended = statute(
+        section("1", subsection(1, "Unchanged one.")),
+        section("2", subsection(1, "Amended two.")),
+        section("4", subsection(1, "Added four.")),
+        section("12", subsection(1, "Unchanged twelve.")),
+        section("12.1", subsection(1, "Amended twelve point one.")),
+    )
+    lexical, citations = LexicalIndex(), CitationIndex()
+    vectorstore = main.create_vector_store(segments(original), lexical=lexical, citations=citations)
+    embeddings.embedded.clear()
+
+    stats = main.update_vector_store(vectorstore, segments(amended), lexical=lexical, citations=citations)
+
+    assert stats == {"unchanged": 2, "changed": 2, "added": 1, "removed": 1, "chunks_added": 3}
+    assert sorted(embeddings.embedded) == ["Added four.", "Amended twelve point one.", "Amended two."]
+    assert stored_chunks(vectorstore) == stored_chunks(main.create_vector_store(segments(amended)))
+    assert citations.resolve("section 3") == []
+    assert citations.resolve("section 12.1") == [("12.1",)]
+    assert lexical.search("removed", 5) == []
+
+
+def test_update_with_the_same_document_changes_nothing(monkeypatch):
+    embeddings = CountingEmbeddings()
+    monkeypatch.setattr(main, "embeddings", embeddings)
+    document = statute(section("1", subsection(1, "One.")), section("1.1", subsection(1, "One point one.")))
+    vectorstore = main.create_vector_store(segments(document))
+    embeddings.embedded.clear()
+
+    stats = main.update_vector_store(vectorstore, segments(document))
+
+    assert stats == {"unchanged": 2, "changed": 0, "added": 0, "removed": 0, "chunks_added": 0}
+    assert embeddings.embedded == []
@@ -0,0 +1,122 @@
+import hashlib
+
+from langchain_core.embeddings import Embeddings
+
+import pdf_pipeline
+from memory_pinecone import InMemoryPineconeIndex
+from pdf_pipeline import document_id, file_hash, index_pdf, pinecone_existing, pinecone_upserter
+
+
+class CountingEmbeddings(Embeddings):
+    """
+    Deterministic embeddings that count the texts they are asked to embed.
+    """
+
+    def __init__(self):
+        self.documents = 0
+        self.queries = 0
+
+    def embed_documents(self, texts):
+        self.documents += len(texts)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        self.queries += 1
+        return self._vector(text)
+
+    def _vector(self, text):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [byte / 255 for byte in digest[:8]]
+
+
+def write_pdf(path, pages):
+    """
+    Write a minimal PDF with one line of Helvetica text per page.
+    """
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        stream = f"BT /F1 10 Tf 20 700 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {len(objects)} 0 R /Resources << /Font << /F1 3 0 R >> >> >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    body = b"%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(body))
+        body += f"{number} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(body)
+    body += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    body += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    body += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    path.write_bytes(body)
+
+
+def sample_pdf(tmp_path):
+    path = tmp_path / "sample.pdf"
+    write_pdf(path, [f"Page {number} says the rate for item {number} is {number} percent. " * 3 for number in range(1, 13)])
+    return str(path)
+
+
+def run(pdf_path, index, embeddings):
+    return index_pdf(
+        pdf_path, embeddings, pinecone_upserter(index), existing=pinecone_existing(index),
+        chunk_size=200, chunk_overlap=40, batch_size=8, workers=1,
+    )
+
+
+def test_reindexing_skips_extraction_embedding_and_upserts(tmp_path, monkeypatch):
+    pdf_path = sample_pdf(tmp_path)
+    index = InMemoryPineconeIndex(dimension=8)
+    embeddings = CountingEmbeddings()
+
+    first = run(pdf_path, index, embeddings)
+    assert first["pages"] == 12
+    assert first["chunks"] > 1
+    assert not first["already_indexed"]
+    assert embeddings.documents == first["chunks"]
+    # Every chunk plus the document marker
+    assert index.describe_index_stats().total_vector_count == first["chunks"] + 1
+
+    def no_extraction(*args, **kwargs):
+        raise AssertionError("an indexed document must not be extracted again")
+
+    monkeypatch.setattr(pdf_pipeline, "iter_pages", no_extraction)
+    upserts, embedded = index.upsert_calls, embeddings.documents
+    second = run(pdf_path, index, embeddings)
+    assert second["already_indexed"]
+    assert second["pages"] == second["chunks"] == 0
+    assert embeddings.documents == embedded
+    assert embeddings.queries == 0
+    assert index.upsert_calls == upserts
+
+
+def test_interrupted_run_only_writes_the_marker(tmp_path):
+    pdf_path = sample_pdf(tmp_path)
+    index = InMemoryPineconeIndex(dimension=8)
+    embeddings = CountingEmbeddings()
+    first = run(pdf_path, index, embeddings)
+
+    # A run stopped after its last chunk batch never wrote the marker
+    marker = document_id(file_hash(pdf_path), 200, 40)
+    index.delete(ids=[marker])
+    upserts, embedded = index.upsert_calls, embeddings.documents
+
+    second = run(pdf_path, index, embeddings)
+    assert not second["already_indexed"]
+    assert second["skipped"] == second["chunks"] == first["chunks"]
+    assert embeddings.documents == embedded
+    assert index.upsert_calls == upserts + 1
+    assert marker in index.fetch(ids=[marker]).vectors
+
+
+def test_marker_is_stored_without_text():
+    index = InMemoryPineconeIndex()
+    upsert = pinecone_upserter(index)
+    upsert(["chunk", "doc-marker"], ["some text", None], [[0.5, 0.5], [1.0, 0.0]], [{"page": 1}, {"chunks": 1}])
+
+    stored = index.fetch(ids=["chunk", "doc-marker"]).vectors
+    assert stored["chunk"].metadata == {"page": 1, "text": "some text"}
+    assert stored["doc-marker"].metadata == {"chunks": 1}
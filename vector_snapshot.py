@@ -0,0 +1,215 @@
+import os
+import json
+import shutil
+import sqlite3
+import logging
+import threading
+import time
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, NamedTuple, Optional, Union
+
+import faiss
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+from citation_index import CitationIndex
+from lexical_index import LexicalIndex
+
+# File names inside a snapshot directory
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.sqlite"
+LEXICAL_FILE = "lexical.json"
+CITATIONS_FILE = "citations.json"
+# Pointer file naming the active snapshot version
+CURRENT_FILE = "CURRENT"
+# Number of snapshot versions kept on disk
+SNAPSHOTS_KEPT = 2
+
+
+class SearchIndex(NamedTuple):
+    """
+    A vector store, its lexical and citation indexes and the snapshot version they were
+    loaded from, published together so a query never mixes two versions.
+    """
+    vectorstore: FAISS
+    lexical: LexicalIndex
+    citations: Optional[CitationIndex] = None
+    version: Optional[str] = None
+
+
+class SqliteDocstore(Docstore):
+    """
+    Read-only docstore that looks documents up in a snapshot's SQLite file on demand,
+    so loading a snapshot does not read every chunk into memory.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+
+    def search(self, search: str) -> Union[str, Document]:
+        with self._lock:
+            row = self._conn.execute("SELECT content, metadata FROM docs WHERE id = ?", (search,)).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+
+
+class SqliteIdMap(Mapping):
+    """
+    Read-only mapping from FAISS index position to docstore id backed by a snapshot's SQLite file.
+    """
+
+    def __init__(self, docstore: SqliteDocstore):
+        self._docstore = docstore
+
+    def _query(self, sql: str, params=()) -> List[tuple]:
+        with self._docstore._lock:
+            return self._docstore._conn.execute(sql, params).fetchall()
+
+    def __getitem__(self, position) -> str:
+        rows = self._query("SELECT id FROM docs WHERE position = ?", (int(position),))
+        if not rows:
+            raise KeyError(position)
+        return rows[0][0]
+
+    def __len__(self) -> int:
+        return self._query("SELECT COUNT(*) FROM docs")[0][0]
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(position for (position,) in self._query("SELECT position FROM docs ORDER BY position"))
+
+    def items(self):
+        return self._query("SELECT position, id FROM docs ORDER BY position")
+
+    def values(self):
+        return [doc_id for (doc_id,) in self._query("SELECT id FROM docs ORDER BY position")]
+
+    def positions(self, doc_ids: List[str]) -> Dict[str, int]:
+        """
+        Reverse lookup: the index positions of the given docstore ids, skipping unknown ids.
+        """
+        if not doc_ids:
+            return {}
+        placeholders = ",".join("?" * len(doc_ids))
+        return {doc_id: position for position, doc_id in self._query(f"SELECT position, id FROM docs WHERE id IN ({placeholders})", list(doc_ids))}
+
+
+def current_version(root: str) -> Optional[str]:
+    """
+    Return the active snapshot version under root, if any.
+    """
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def save_snapshot(
+    vectorstore: FAISS,
+    root: str,
+    lexical: Optional[LexicalIndex] = None,
+    citations: Optional[CitationIndex] = None,
+) -> str:
+    """
+    Write the FAISS index, its documents and optionally its lexical and citation indexes to a
+    new snapshot version under root and make it current.
+    """
+    version = str(time.time_ns())
+    staging = os.path.join(root, f".{version}.tmp")
+    os.makedirs(staging)
+
+    faiss.write_index(vectorstore.index, os.path.join(staging, INDEX_FILE))
+    conn = sqlite3.connect(os.path.join(staging, DOCSTORE_FILE))
+    conn.execute("CREATE TABLE docs (position INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, content TEXT NOT NULL, metadata TEXT NOT NULL)")
+    rows = (
+        (int(position), doc_id, doc.page_content, json.dumps(doc.metadata))
+        for position, doc_id in vectorstore.index_to_docstore_id.items()
+        for doc in [vectorstore.docstore.search(doc_id)]
+    )
+    conn.executemany("INSERT INTO docs VALUES (?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+    if lexical is not None:
+        lexical.save(os.path.join(staging, LEXICAL_FILE))
+    if citations is not None:
+        citations.save(os.path.join(staging, CITATIONS_FILE))
+
+    os.rename(staging, os.path.join(root, version))
+    pointer = os.path.join(root, f".{CURRENT_FILE}.tmp")
+    with open(pointer, "w") as f:
+        f.write(version)
+    os.replace(pointer, os.path.join(root, CURRENT_FILE))
+    logging.info(f"Snapshot {version} saved to {root}")
+
+    versions = sorted(name for name in os.listdir(root) if name.isdigit())
+    for old in versions[:-SNAPSHOTS_KEPT]:
+        shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+    return version
+
+
+def load_snapshot(root: str, embeddings: Embeddings, writable: bool = False, version: Optional[str] = None) -> Optional[FAISS]:
+    """
+    Load the vector store of the current snapshot under root, or of the given version.
+
+    By default the index file is mapped in place (IO_FLAG_MMAP_IFC) and documents are read from
+    SQLite on demand, so startup time and private memory do not grow with corpus size. The mapped
+    vectors are file-backed pages: they count towards RSS once searched, but live in the page
+    cache, are shared by every process serving the snapshot and can be reclaimed. (Plain
+    IO_FLAG_MMAP would still copy a flat index into anonymous memory.) With writable=True the index
+    and all documents are read into memory so the vector store can be modified.
+    """
+    version = version or current_version(root)
+    if version is None:
+        return None
+    path = os.path.join(root, version)
+    docstore = SqliteDocstore(os.path.join(path, DOCSTORE_FILE))
+
+    if writable:
+        index = faiss.read_index(os.path.join(path, INDEX_FILE))
+        id_map = dict(SqliteIdMap(docstore).items())
+        docstore = InMemoryDocstore({doc_id: docstore.search(doc_id) for doc_id in id_map.values()})
+    else:
+        try:
+            index = faiss.read_index(os.path.join(path, INDEX_FILE), faiss.IO_FLAG_MMAP_IFC)
+        except RuntimeError as e:
+            logging.warning(f"Index type cannot be memory-mapped, reading it into memory: {e}")
+            index = faiss.read_index(os.path.join(path, INDEX_FILE))
+        id_map = SqliteIdMap(docstore)
+
+    logging.info(f"Snapshot {version} loaded from {root}: {index.ntotal} vectors")
+    return FAISS(embeddings, index, docstore, id_map)
+
+
+def load_search_index(root: str, embeddings: Embeddings, writable: bool = False) -> Optional[SearchIndex]:
+    """
+    Load the vector store, lexical index and citation index of the current snapshot under root.
+    Indexes missing from older snapshots are built from the snapshot's documents.
+    """
+    version = current_version(root)
+    if version is None:
+        return None
+    vectorstore = load_snapshot(root, embeddings, writable=writable, version=version)
+    lexical_path = os.path.join(root, version, LEXICAL_FILE)
+    citations_path = os.path.join(root, version, CITATIONS_FILE)
+    lexical = LexicalIndex.load(lexical_path) if os.path.exists(lexical_path) else None
+    citations = CitationIndex.load(citations_path) if os.path.exists(citations_path) else None
+
+    if lexical is None or citations is None:
+        logging.info(f"Snapshot {version} is missing side indexes, building them from the docstore")
+        rebuild_lexical, rebuild_citations = lexical is None, citations is None
+        lexical = LexicalIndex() if rebuild_lexical else lexical
+        citations = CitationIndex() if rebuild_citations else citations
+        for doc_id in vectorstore.index_to_docstore_id.values():
+            doc = vectorstore.docstore.search(doc_id)
+            if rebuild_lexical:
+                lexical.add([doc_id], [doc.page_content])
+            if rebuild_citations:
+                citations.add([doc_id], [doc.metadata])
+
+    logging.info(f"Snapshot {version} indexes loaded: {len(lexical.postings)} terms, {len(citations)} cited chunks")
+    return SearchIndex(vectorstore, lexical, citations, version)